@@ -0,0 +1,22 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Concurrency limits
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))  # threads for blocking Pinecone / CPU work
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "32"))  # requests processed at once
+REQUEST_QUEUE_TIMEOUT_SECONDS = float(os.getenv("REQUEST_QUEUE_TIMEOUT_SECONDS", "10"))  # wait for a slot before 503
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "90"))  # whole request, before 504
+
+_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="exam-io")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call on the bounded I/O pool instead of the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+def shutdown_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
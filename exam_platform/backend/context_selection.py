@@ -0,0 +1,164 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from pinecone_text.sparse import BM25Encoder
+
+# Selection tuning
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "12000"))  # prompt tokens spent on context
+MMR_LAMBDA = 0.6  # 1.0 = pure relevance, 0.0 = pure diversity
+PYQ_WEIGHT = 1.5  # relevance multiplier for chunks taken from previous year question papers
+TOPIC_WEIGHT = 0.7  # share of relevance that comes from the requested topic, when one is given
+CHARS_PER_TOKEN = 4  # rough estimate; close enough for English prose under Gemini's tokenizer
+PYQ_MIN_QUESTION_LINES = 3  # question-like lines that make an unlabelled chunk count as a PYQ
+TOPIC_INDEX_CACHE_SIZE = 8  # corpora whose fitted BM25 topic index is kept in memory
+
+# File names that say "question paper": pyq, past/previous year(s), question paper, mid/end-sem exam
+_PYQ_SOURCE_RE = re.compile(
+    r"(?<![a-z])pyqs?(?![a-z])|(past|previous)[\s_-]?years?|question[\s_-]?papers?"
+    r"|(end|mid)[\s_-]?sem(ester)?[\s_-]?(exams?|papers?)",
+    re.IGNORECASE,
+)
+# Lines that read like exam questions rather than a numbered list in notes: "Q1"/"Question 2" labels,
+# numbered instructions ("3. Explain ..."), marks annotations, or a trailing question mark
+_QUESTION_LINE_RE = re.compile(
+    r"^\s*(Q(uestion)?\s*\.?\s*\d+\b"
+    r"|\d+\s*[.)]\s*(explain|define|describe|discuss|compare|differentiate|distinguish|derive|prove|justify"
+    r"|illustrate|evaluate|write\s+(a\s+)?(short\s+)?notes?)\b)"
+    r"|[(\[]\s*\d+\s*(marks?|m)\s*[)\]]|\?\s*$",
+    re.IGNORECASE,
+)
+
+_topic_indexes = OrderedDict()  # corpus key -> (encoder, rows, terms, values)
+_topic_indexes_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def is_pyq(record: dict) -> bool:
+    """PYQ chunks come from a question-paper file, or read like one (labelled questions, marks)"""
+    if _PYQ_SOURCE_RE.search(os.path.basename(record.get("source") or "")):
+        return True
+    lines = record["context"].splitlines()
+    return sum(1 for line in lines if _QUESTION_LINE_RE.search(line)) >= PYQ_MIN_QUESTION_LINES
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _rescale(scores):
+    span = scores.max() - scores.min() if len(scores) else 0.0
+    return (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+
+
+def _topic_index(records: List[dict], texts: List[str]):
+    """
+    BM25 encoder fitted on this corpus plus its document vectors flattened
+    CSR-style into parallel (row, term, value) arrays. Cached per corpus
+    (keyed by its chunk IDs), so topic requests neither refit nor re-encode.
+    """
+    key = hashlib.sha1("\n".join(r.get("id") or t for r, t in zip(records, texts)).encode("utf-8")).hexdigest()
+    with _topic_indexes_lock:
+        cached = _topic_indexes.get(key)
+        if cached is not None:
+            _topic_indexes.move_to_end(key)
+            return cached
+
+    encoder = BM25Encoder()
+    try:
+        encoder.fit(texts)
+    except ZeroDivisionError:  # no tokens anywhere in the corpus
+        encoder = None
+    rows = terms = values = np.zeros(0)
+    if encoder is not None:
+        docs = encoder.encode_documents(texts)
+        lengths = [len(d["indices"]) for d in docs]
+        if sum(lengths):
+            rows = np.repeat(np.arange(len(docs)), lengths)
+            terms = np.concatenate([np.asarray(d["indices"], dtype=np.int64) for d in docs])
+            values = np.concatenate([np.asarray(d["values"], dtype=np.float32) for d in docs])
+
+    with _topic_indexes_lock:
+        _topic_indexes[key] = (encoder, rows, terms, values)
+        while len(_topic_indexes) > TOPIC_INDEX_CACHE_SIZE:
+            _topic_indexes.popitem(last=False)
+    return encoder, rows, terms, values
+
+
+def _topic_scores(records: List[dict], texts: List[str], topic: str):
+    """BM25 score of every chunk against the topic, as one vectorised sparse dot product"""
+    encoder, rows, terms, values = _topic_index(records, texts)
+    scores = np.zeros(len(texts), dtype=np.float32)
+    if encoder is None or not len(terms):
+        return scores
+    query = encoder.encode_queries(topic)
+    if not query["indices"]:
+        return scores
+    order = np.argsort(np.asarray(query["indices"], dtype=np.int64))
+    query_terms = np.asarray(query["indices"], dtype=np.int64)[order]
+    query_weights = np.asarray(query["values"], dtype=np.float32)[order]
+    pos = np.minimum(np.searchsorted(query_terms, terms), len(query_terms) - 1)
+    hit = query_terms[pos] == terms
+    return np.bincount(rows[hit], weights=values[hit] * query_weights[pos[hit]], minlength=len(texts)).astype(np.float32)
+
+
+def select_contexts(records: List[dict], topic: Optional[str] = None, num_contexts: Optional[int] = None,
+                    token_budget: int = CONTEXT_TOKEN_BUDGET, lambda_mult: float = MMR_LAMBDA,
+                    pyq_weight: float = PYQ_WEIGHT, jitter: float = 0.0) -> List[str]:
+    """
+    Pick a diverse, high-value subset of chunks that fits within token_budget
+    (and num_contexts, if given), using Maximal Marginal Relevance over the
+    stored dense vectors.
+    Relevance is closeness to the corpus centroid (how central a chunk is to
+    the material), blended with BM25 similarity to `topic` when one is given,
+    and boosted by pyq_weight for PYQ chunks. Redundancy is the highest cosine
+    similarity to any chunk already picked. A non-zero `jitter` randomly
+    perturbs relevance by up to that fraction, so repeated calls cover
+    different parts of the corpus.
+    """
+    records = [r for r in records if r["context"].strip()]
+    if not records:
+        return []
+
+    texts = [r["context"] for r in records]
+    dims = {len(r["values"]) for r in records if r.get("values") is not None}
+    dim = dims.pop() if len(dims) == 1 else 0
+    vectors = np.zeros((len(records), max(dim, 1)), dtype=np.float32)
+    if dim:
+        for i, r in enumerate(records):
+            if r.get("values") is not None:
+                vectors[i] = r["values"]
+    vectors = _normalize_rows(vectors)
+
+    centroid = vectors.mean(axis=0)
+    relevance = _rescale(vectors @ (centroid / max(np.linalg.norm(centroid), 1e-12)))
+    if topic and topic.strip():
+        relevance = TOPIC_WEIGHT * _rescale(_topic_scores(records, texts, topic)) + (1 - TOPIC_WEIGHT) * relevance
+    relevance = relevance * np.array([pyq_weight if is_pyq(r) else 1.0 for r in records], dtype=np.float32)
+    if jitter:
+        relevance = relevance * (1 + jitter * np.random.default_rng().random(len(records)))
+
+    tokens = np.array([estimate_tokens(t) for t in texts])
+    max_picks = min(num_contexts or len(records), len(records))
+    redundancy = np.zeros(len(records), dtype=np.float32)
+    available = tokens <= token_budget
+    selected, remaining = [], token_budget
+
+    while len(selected) < max_picks and available.any():
+        mmr = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        remaining -= tokens[best]
+        available[best] = False
+        available &= tokens <= remaining
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+
+    return [texts[i] for i in selected]
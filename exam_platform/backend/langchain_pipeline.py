@@ -1,54 +1,263 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.messages import HumanMessage
+from pydantic import ValidationError
+import asyncio
 import json
 import re
+import threading
+from typing import AsyncIterator, List, Optional
 from pinecone_utils import get_all_context_from_pinecone
+from schemas import MCQ
 import os
 
-def generate_mcqs_from_context(context: str):
-    """Generate 10 MCQs with 4 options and correct answers using LLM"""
-    
-    prompt_template = PromptTemplate.from_template("""
-    You are an experienced exam setter. Based on the given previous year questions and context, generate exactly 10 multiple-choice questions that could appear in the next exam.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))  # Gemini calls in flight at once
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = 2
+MCQS_PER_CALL = 10
+MCQ_REPAIR_ROUNDS = 2  # follow-up calls that only regenerate the questions still missing
+
+MCQ_PROMPT = PromptTemplate.from_template("""
+    You are an experienced exam setter. Based on the given previous year questions and context, generate exactly {count} multiple-choice questions that could appear in the next exam.
     Each question must have:
     - question text
-    - 4 options (A, B, C, D)
-    - one correct answer key
+    - 4 options, each starting with its letter ("A. ...", "B. ...", "C. ...", "D. ...")
+    - one correct answer key (the letter only)
 
     Output strictly as a valid JSON array:
     [
       {{
         "question": "...",
-        "options": ["A", "B", "C", "D"],
+        "options": ["A. ...", "B. ...", "C. ...", "D. ..."],
         "answer": "A"
       }},
       ...
     ]
-
+    {exclude}
     Context:
     {context}
     """)
 
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.7,google_api_key=os.getenv("GIMINI_API_KEY"))
-    prompt = prompt_template.format(context=context)
-    response = llm.invoke([HumanMessage(content=prompt)]).content
+_llm = None
+_llm_lock = threading.Lock()
+_llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+
+
+def get_llm():
+    """Gemini client shared by every request (built on first use)"""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            _llm = ChatGoogleGenerativeAI(
+                model="gemini-2.5-flash",
+                temperature=0.7,
+                google_api_key=os.getenv("GIMINI_API_KEY"),
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES,
+                response_mime_type="application/json",
+            )
+        return _llm
+
+
+def _scan_objects(text: str, pos: int = 0, final: bool = True):
+    """
+    Complete JSON objects in text from `pos` on, plus the offset to resume
+    scanning from. While a response is still streaming (final=False) the scan
+    stops at the first object that is not complete yet; on the final text,
+    fragments that never parse are skipped.
+    """
+    items, decoder = [], json.JSONDecoder()
+    start = text.find("{", pos)
+    while start != -1:
+        try:
+            obj, end = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            if not final:
+                return items, start
+            start = text.find("{", start + 1)
+            continue
+        if isinstance(obj, dict):
+            items.append(obj)
+        pos = end
+        start = text.find("{", end)
+    return items, (len(text) if final else pos)
+
+
+_OPENING_RE = re.compile(r"[\[{]")
+_WRAPPER_TOKENS = ('"questions"', ":", "[")  # after the "{" of a {"questions": [...]} wrapper
+
+
+def _skip_wrapper(text: str, pos: int = 0):
+    """
+    Step inside a {"questions": [...]} wrapper, so a streaming scan sees the
+    questions one by one instead of waiting for (and then rejecting) the
+    wrapper as one object. Whitespace, code fences or prose before the JSON
+    are passed over. Returns the offset to scan from and whether that is
+    settled: False while the text so far could still be opening a wrapper.
+    """
+    match = _OPENING_RE.search(text, pos)
+    if match is None:
+        return pos, False
+    if match.group() == "[":
+        return pos, True  # a bare array
+    end = match.end()
+    for token in _WRAPPER_TOKENS:
+        while end < len(text) and text[end].isspace():
+            end += 1
+        seen = text[end:end + len(token)]
+        if seen != token[:len(seen)]:
+            return pos, True  # some other object: no wrapper
+        if len(seen) < len(token):
+            return pos, False  # cut off inside the opening
+        end += len(token)
+    return end, True
+
+
+def _unwrap(objects: list) -> list:
+    """Replace any {"questions": [...]} wrapper among the objects with its items"""
+    items = []
+    for obj in objects:
+        questions = obj.get("questions") if isinstance(obj, dict) else None
+        items.extend(questions if isinstance(questions, list) else [obj])
+    return items
+
 
-    # Attempt to clean and parse JSON from LLM output
+def _extract_items(response: str) -> list:
+    """
+    JSON objects from an LLM response. A clean JSON array (or wrapped array)
+    is taken as is; otherwise every top-level object that still parses is
+    salvaged, so one broken item does not cost the rest of the batch.
+    """
     try:
-        json_data = json.loads(response)
+        data = json.loads(response)
+        if isinstance(data, dict):
+            data = data.get("questions", [data])
+        if isinstance(data, list):
+            return data
     except json.JSONDecodeError:
-        # fallback cleanup if model returns extra text
-        match = re.search(r"\[.*\]", response, re.DOTALL)
-        if match:
-            json_data = json.loads(match.group(0))
-        else:
-            json_data = {"error": "Invalid JSON format from LLM", "raw_output": response}
+        pass
+    pos, _ = _skip_wrapper(response)
+    return _unwrap(_scan_objects(response, pos)[0])
+
+
+def _accept(item, mcqs: List[MCQ], limit: int) -> Optional[MCQ]:
+    """
+    Validate one item and append it to mcqs if it is new and fewer than
+    `limit` were accepted so far. Raises ValidationError for a malformed item.
+    """
+    mcq = MCQ.model_validate(item)
+    if len(mcqs) >= limit or any(m.question.lower() == mcq.question.lower() for m in mcqs):
+        return None
+    mcqs.append(mcq)
+    return mcq
+
+
+def _collect_valid(response: str, mcqs: List[MCQ], limit: int) -> int:
+    """Validate items one by one, appending up to `limit` new valid MCQs; returns how many items were rejected"""
+    limit += len(mcqs)
+    rejected = 0
+    for item in _extract_items(response):
+        try:
+            _accept(item, mcqs, limit)
+        except ValidationError:
+            rejected += 1
+    return rejected
+
+
+def _build_prompt(context: str, count: int, mcqs: List[MCQ]) -> str:
+    exclude = ""
+    if mcqs:
+        listed = "\n".join(f"- {m.question}" for m in mcqs)
+        exclude = f"\nDo not repeat any of these questions:\n{listed}\n"
+    return MCQ_PROMPT.format(count=count, exclude=exclude, context=context)
+
+
+def _finish(mcqs: List[MCQ], rejected: int) -> List[dict]:
+    if rejected:
+        print(f"⚠️ Discarded {rejected} malformed MCQ(s) from the LLM output.")
+    if not mcqs:
+        raise Exception("The LLM returned no valid questions")
+    return [m.model_dump() for m in mcqs]
+
+
+def generate_mcqs_from_context(context: str, count: int = MCQS_PER_CALL) -> List[dict]:
+    """
+    Generate `count` MCQs with 4 options and correct answers using LLM.
+    Items that fail schema validation are dropped and only the missing ones
+    are requested again, up to MCQ_REPAIR_ROUNDS times.
+    """
+    mcqs: List[MCQ] = []
+    rejected = 0
+    for _ in range(1 + MCQ_REPAIR_ROUNDS):
+        missing = count - len(mcqs)
+        if missing <= 0:
+            break
+        response = get_llm().invoke([HumanMessage(content=_build_prompt(context, missing, mcqs))]).content
+        rejected += _collect_valid(response, mcqs, missing)
+    return _finish(mcqs, rejected)
+
+
+async def agenerate_mcqs_from_context(context: str, count: int = MCQS_PER_CALL) -> List[dict]:
+    """Async generate_mcqs_from_context; at most LLM_CONCURRENCY calls run at once"""
+    mcqs: List[MCQ] = []
+    rejected = 0
+    for _ in range(1 + MCQ_REPAIR_ROUNDS):
+        missing = count - len(mcqs)
+        if missing <= 0:
+            break
+        prompt = _build_prompt(context, missing, mcqs)
+        async with _llm_slots:
+            response = await asyncio.wait_for(
+                get_llm().ainvoke([HumanMessage(content=prompt)]), timeout=LLM_TIMEOUT_SECONDS * (LLM_MAX_RETRIES + 1)
+            )
+        rejected += _collect_valid(response.content, mcqs, missing)
+    return _finish(mcqs, rejected)
+
 
-    return json.dumps(json_data, indent=2)
+async def astream_mcqs_from_context(context: str, count: int = MCQS_PER_CALL) -> AsyncIterator[dict]:
+    """
+    Streaming agenerate_mcqs_from_context: each MCQ is validated and yielded
+    as soon as the LLM has finished writing it. Questions still missing at the
+    end are regenerated like in the non-streaming version.
+    """
+    mcqs: List[MCQ] = []
+    rejected = 0
+    for _ in range(1 + MCQ_REPAIR_ROUNDS):
+        if len(mcqs) >= count:
+            break
+        prompt = _build_prompt(context, count - len(mcqs), mcqs)
+        buffer, pos, settled = "", 0, False
+        async with _llm_slots:
+            async for chunk in get_llm().astream([HumanMessage(content=prompt)]):
+                buffer += chunk.content
+                if not settled:  # step inside a wrapper object once it is clear whether there is one
+                    pos, settled = _skip_wrapper(buffer, pos)
+                    if not settled:
+                        continue
+                items, pos = _scan_objects(buffer, pos, final=False)
+                for item in items:
+                    try:
+                        mcq = _accept(item, mcqs, count)
+                    except ValidationError:
+                        rejected += 1
+                        continue
+                    if mcq is not None:
+                        yield mcq.model_dump()
+        # whatever is left once the stream ends: the last object, or fragments that never parsed
+        if not settled:
+            pos, _ = _skip_wrapper(buffer, pos)
+        for item in _unwrap(_scan_objects(buffer, pos)[0]):
+            try:
+                mcq = _accept(item, mcqs, count)
+            except ValidationError:
+                rejected += 1
+                continue
+            if mcq is not None:
+                yield mcq.model_dump()
+    _finish(mcqs, rejected)
 
 
 if __name__ == "__main__":
     context = get_all_context_from_pinecone()
     mcqs = generate_mcqs_from_context(context)
-    print(mcqs)
\ No newline at end of file
+    print(json.dumps(mcqs, indent=2))
@@ -1,11 +1,37 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from pinecone_utils import get_all_context_from_pinecone
-from langchain_pipeline import generate_mcqs_from_context
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from pinecone_utils import iter_records_from_pinecone
+from context_selection import select_contexts
+from langchain_pipeline import agenerate_mcqs_from_context, astream_mcqs_from_context
+from mcq_pool import MCQPool
+from schemas import QuestionsResponse
+from async_utils import (
+    run_blocking,
+    shutdown_executor,
+    MAX_CONCURRENT_REQUESTS,
+    REQUEST_QUEUE_TIMEOUT_SECONDS,
+    REQUEST_TIMEOUT_SECONDS,
+)
 from fastapi.middleware.cors import CORSMiddleware
 
 
-app = FastAPI(title="Exam Platform ")
+mcq_pool = MCQPool()
+request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await mcq_pool.close()
+    shutdown_executor()
+
+
+app = FastAPI(title="Exam Platform ", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,19 +39,110 @@ app.add_middleware(
 )
 
 class TopicRequest(BaseModel):
-    topic: str
-    num_contexts: int = 5
+    topic: str = ""  # optional focus; empty = whole syllabus
+    num_contexts: Optional[int] = Field(None, ge=1)  # max chunks; None = fill the context token budget
 
-@app.post("/generate-questions")
-async def generate_questions():
-    try:
-        # 1. Retrieve relevant context
-        context = get_all_context_from_pinecone()
 
-        # 2. Generate MCQs from context
-        mcqs = generate_mcqs_from_context(context)
+def _use_pool(request: Optional[TopicRequest]) -> bool:
+    # plain quiz: served from the pre-generated pool, de-duplicated per student
+    return request is None or (not request.topic and request.num_contexts is None)
 
+
+async def _select_context(corpus: str, request: TopicRequest) -> str:
+    """Retrieve context (only the requesting student's corpus), bounded and ranked"""
+    records = await run_blocking(lambda: list(iter_records_from_pinecone(namespace=corpus)))
+    contexts = await run_blocking(
+        select_contexts, records, topic=request.topic, num_contexts=request.num_contexts
+    )
+    if not contexts:
+        raise HTTPException(status_code=404, detail="No study material found for this corpus")
+    return "\n\n".join(contexts)
+
+
+async def _generate(corpus: str, student: str, request: Optional[TopicRequest]):
+    if _use_pool(request):
+        mcqs = await mcq_pool.serve(corpus, student)
         return {"questions": mcqs}
 
+    # 1. Retrieve relevant context
+    context = await _select_context(corpus, request)
+
+    # 2. Generate MCQs from context
+    mcqs = await agenerate_mcqs_from_context(context)
+
+    return {"questions": mcqs}
+
+
+async def _acquire_slot():
+    try:
+        await asyncio.wait_for(request_slots.acquire(), timeout=REQUEST_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server busy, please retry shortly")
+
+
+@app.post("/generate-questions", response_model=QuestionsResponse)
+async def generate_questions(corpus: str = "", student: str = "", request: Optional[TopicRequest] = None):
+    await _acquire_slot()
+    try:
+        return await asyncio.wait_for(_generate(corpus, student, request), timeout=REQUEST_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Question generation timed out")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        request_slots.release()
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _question_stream(corpus: str, student: str, request: Optional[TopicRequest]) -> AsyncIterator[dict]:
+    """MCQs for one request as they become ready: pooled ones at once, fresh ones as the LLM writes them"""
+    if _use_pool(request):
+        for mcq in await mcq_pool.serve(corpus, student):
+            yield mcq
+        return
+    context = await _select_context(corpus, request)
+    async for mcq in astream_mcqs_from_context(context):
+        yield mcq
+
+
+@app.post("/generate-questions/stream")
+async def generate_questions_stream(corpus: str = "", student: str = "", request: Optional[TopicRequest] = None):
+    """
+    Server-sent events variant of /generate-questions: one `question` event per
+    MCQ as soon as it is ready, then `done` (or `error`). The whole stream is
+    bounded by REQUEST_TIMEOUT_SECONDS, like the JSON endpoint.
+    """
+    async def events():
+        # the slot is taken inside the stream, so it is always released with it
+        try:
+            await _acquire_slot()
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail})
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + REQUEST_TIMEOUT_SECONDS
+        questions = _question_stream(corpus, student, request)
+        try:
+            while True:
+                try:
+                    mcq = await asyncio.wait_for(questions.__anext__(), timeout=max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                yield _sse("question", mcq)
+            yield _sse("done", {})
+        except asyncio.TimeoutError:
+            yield _sse("error", {"detail": "Question generation timed out"})
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            await questions.aclose()
+            request_slots.release()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
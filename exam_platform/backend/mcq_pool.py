@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import os
+import re
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Set, Tuple
+from pinecone_utils import iter_records_from_pinecone, namespace_version
+from context_selection import select_contexts
+from langchain_pipeline import agenerate_mcqs_from_context
+from async_utils import run_blocking
+
+# Pool tuning
+QUIZ_SIZE = 10  # questions served per quiz
+POOL_TARGET_SIZE = int(os.getenv("MCQ_POOL_TARGET_SIZE", "40"))  # refill a corpus pool up to this many questions
+POOL_LOW_WATER = int(os.getenv("MCQ_POOL_LOW_WATER", "20"))  # start refilling below this many
+MAX_FAILED_REFILLS = 3  # consecutive empty generations before a refill gives up
+MAX_TRACKED_STUDENTS = 10_000  # students whose served questions are remembered (least recent dropped)
+REFILL_CONTEXT_JITTER = 0.3  # vary the selected context between refills so generations differ
+
+def question_key(mcq: dict) -> str:
+    """Identity of a question for de-duplication: its text, ignoring case, spacing and punctuation"""
+    text = re.sub(r"[\W_]+", " ", mcq["question"].lower()).strip()
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class MCQPool:
+    """
+    Validated, pre-generated MCQs per corpus, topped up by a background task
+    whenever a pool drops below POOL_LOW_WATER. Serving a quiz only pops from
+    memory; questions a student has already been served are skipped and left
+    in the pool for other students of the same corpus.
+    A pool belongs to one version of its corpus (see namespace_version) and is
+    flushed once the corpus is seen to have changed; a warm pool is checked in
+    the background after serving, so a quiz never waits on a namespace listing. At most one generation runs per
+    corpus version; cold requests and refills all wait on that one.
+    """
+
+    def __init__(self):
+        self._pools: Dict[str, Deque[dict]] = {}
+        self._keys: Dict[str, Set[str]] = {}  # every question key ever pooled, per corpus
+        self._versions: Dict[str, str] = {}  # corpus -> version its pool was generated from
+        self._generations: Dict[Tuple[str, str], asyncio.Task] = {}  # (corpus, version) -> in-flight generation
+        self._refills: Dict[str, asyncio.Task] = {}
+        self._checks: Dict[str, asyncio.Task] = {}  # corpus -> background version check
+        self._seen: "OrderedDict[str, Set[str]]" = OrderedDict()  # "corpus/student" -> served question keys
+        self._lock = asyncio.Lock()
+
+    def _pool(self, corpus: str) -> Deque[dict]:
+        return self._pools.setdefault(corpus, deque())
+
+    def _seen_by(self, corpus: str, student: str) -> Set[str]:
+        key = f"{corpus}/{student}"
+        seen = self._seen.pop(key, None) or set()
+        self._seen[key] = seen
+        while len(self._seen) > MAX_TRACKED_STUDENTS:
+            self._seen.popitem(last=False)
+        return seen
+
+    async def _check_version(self, corpus: str) -> str:
+        """Current version of a corpus; a pool built from an older version is dropped"""
+        version = await run_blocking(namespace_version, corpus)
+        async with self._lock:
+            if self._versions.get(corpus) != version:
+                if corpus in self._versions:
+                    print(f"Corpus '{corpus}' changed; flushing its MCQ pool.")
+                self._versions[corpus] = version
+                self._pools[corpus] = deque()
+                self._keys[corpus] = set()
+        return version
+
+    async def _generate(self, corpus: str, version: str) -> List[dict]:
+        """Run one generation for a corpus and pool its new, valid questions; returns the ones added"""
+        records = await run_blocking(lambda: list(iter_records_from_pinecone(namespace=corpus)))
+        contexts = await run_blocking(select_contexts, records, jitter=REFILL_CONTEXT_JITTER)
+        if not contexts:
+            raise Exception("No context stored for this corpus")
+        mcqs = await agenerate_mcqs_from_context("\n\n".join(contexts))
+        async with self._lock:
+            if self._versions.get(corpus) != version:
+                return []  # the corpus changed while generating; these questions are stale
+            keys = self._keys.setdefault(corpus, set())
+            pool = self._pool(corpus)
+            added = []
+            for mcq in mcqs:
+                key = question_key(mcq)
+                if key not in keys:
+                    keys.add(key)
+                    added.append({**mcq, "key": key})
+            pool.extend(added)
+        return added
+
+    def _generation(self, corpus: str, version: str) -> asyncio.Task:
+        """The in-flight generation for this corpus version, started if none is running"""
+        key = (corpus, version)
+        task = self._generations.get(key)
+        if task is None:
+            task = asyncio.create_task(self._generate(corpus, version))
+            self._generations[key] = task
+            task.add_done_callback(lambda done: self._forget_generation(key, done))
+        return task
+
+    def _forget_generation(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        if self._generations.get(key) is task:
+            del self._generations[key]
+
+    async def _refill(self, corpus: str) -> None:
+        failures = 0
+        try:
+            while len(self._pool(corpus)) < POOL_TARGET_SIZE and failures < MAX_FAILED_REFILLS:
+                try:
+                    version = await self._check_version(corpus)
+                    added = len(await self._generation(corpus, version))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ MCQ pool refill failed for corpus '{corpus}': {e}")
+                    added = 0
+                failures = 0 if added else failures + 1
+        finally:
+            self._refills.pop(corpus, None)
+
+    def schedule_refill(self, corpus: str) -> None:
+        """Start a background top-up for a corpus unless one is already running"""
+        if corpus not in self._refills and len(self._pool(corpus)) < POOL_LOW_WATER:
+            self._refills[corpus] = asyncio.create_task(self._refill(corpus))
+
+    async def _recheck(self, corpus: str) -> None:
+        try:
+            await self._check_version(corpus)
+        except Exception as e:
+            print(f"⚠️ MCQ pool version check failed for corpus '{corpus}': {e}")
+        finally:
+            self._checks.pop(corpus, None)
+        self.schedule_refill(corpus)
+
+    def schedule_check(self, corpus: str) -> None:
+        """Re-check a corpus version in the background (flushing a stale pool), then top it up"""
+        if corpus not in self._checks:
+            self._checks[corpus] = asyncio.create_task(self._recheck(corpus))
+
+    async def _take(self, corpus: str, student: str, n: int, shared: List[dict] = ()) -> List[dict]:
+        """
+        Pop up to n unseen questions from the pool, then top up from `shared`:
+        the questions of a generation this request waited on, which every
+        waiter may serve (they stay in the pool for later students too).
+        """
+        async with self._lock:
+            seen = self._seen_by(corpus, student)
+            pool = self._pool(corpus)
+            taken, skipped = [], []
+            while pool and len(taken) < n:
+                mcq = pool.popleft()
+                (skipped if mcq["key"] in seen else taken).append(mcq)
+            pool.extendleft(reversed(skipped))
+            taken_keys = {mcq["key"] for mcq in taken}
+            for mcq in shared:
+                if len(taken) >= n:
+                    break
+                if mcq["key"] not in seen and mcq["key"] not in taken_keys:
+                    taken.append(mcq)
+                    taken_keys.add(mcq["key"])
+            seen.update(taken_keys)
+            return taken
+
+    async def serve(self, corpus: str, student: str = "", n: int = QUIZ_SIZE) -> List[dict]:
+        """
+        Pop up to n questions this student has not been served yet. A warm
+        pool answers straight from memory; the version check and top-up happen
+        in the background after the quiz is returned. Only a cold pool checks
+        the version inline and waits for a generation (joining the one already
+        running, if any).
+        """
+        known = self._versions.get(corpus)
+        taken = await self._take(corpus, student, n) if known is not None else []
+        if len(taken) < n:
+            version = await self._check_version(corpus)
+            if version != known:
+                taken = []  # popped from a pool that has just been flushed as stale
+            # cold start (or this student has seen the whole pool): wait for one shared generation
+            try:
+                # shielded: a client that disconnects must not cancel it for everyone else waiting
+                fresh = await asyncio.shield(self._generation(corpus, version))
+            except Exception:
+                if not taken:
+                    raise
+                fresh = []
+            taken += await self._take(corpus, student, n - len(taken), shared=fresh)
+            self.schedule_refill(corpus)
+        else:
+            self.schedule_check(corpus)
+        if not taken:
+            raise Exception("Could not generate any valid questions")
+        return [{k: v for k, v in mcq.items() if k != "key"} for mcq in taken]
+
+    async def close(self) -> None:
+        tasks = list(self._checks.values()) + list(self._refills.values()) + list(self._generations.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,4 +1,11 @@
+import hashlib
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
 from pinecone import Pinecone
 from dotenv import load_dotenv
 
@@ -7,39 +14,197 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 
+# Export tuning
+EXPORT_LIST_PAGE_SIZE = 100  # IDs per list() page (the API maximum)
+EXPORT_FETCH_BATCH_SIZE = 100  # IDs per fetch(); chunk IDs are 64-char hashes, so this keeps URLs under ~8 KB
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "8"))  # parallel fetch() requests
+SNAPSHOT_DIR = os.getenv("CONTEXT_SNAPSHOT_DIR", ".context_snapshots")
+SNAPSHOT_VERSION = 3
+CORPUS_VERSION_TTL_SECONDS = float(os.getenv("CORPUS_VERSION_TTL_SECONDS", "10"))  # how long a listed ID set is trusted
+
 pc = Pinecone(api_key=PINECONE_API_KEY)
 
+_index = None
+_index_lock = threading.Lock()
+_snapshots: Dict[str, dict] = {}
+_snapshots_lock = threading.Lock()
+_listings: Dict[str, tuple] = {}  # namespace -> (listed_at, version, ids)
+
+
+def get_index():
+    """Shared Index client, with one pooled connection per concurrent fetch"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = pc.Index(INDEX_NAME, pool_threads=EXPORT_CONCURRENCY)
+        return _index
+
+
+def _snapshot_path(namespace: str) -> str:
+    """Base path of a namespace's snapshot: <base>.json holds the text, <base>.npy the dense vectors"""
+    name = hashlib.sha1(namespace.encode("utf-8")).hexdigest()
+    return os.path.join(SNAPSHOT_DIR, name)
+
+
+def _load_snapshot(namespace: str) -> dict:
+    """
+    Last export of a namespace: {id: {"context", "source", "values"}} records
+    and the namespace version they were taken at.
+    """
+    with _snapshots_lock:
+        snapshot = _snapshots.get(namespace)
+        if snapshot is None:
+            snapshot = {"version": None, "records": {}}
+            base = _snapshot_path(namespace)
+            try:
+                with open(base + ".json", "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("namespace") == namespace and data.get("version") == SNAPSHOT_VERSION:
+                    vectors = np.load(base + ".npy")
+                    records = {}
+                    for row, (_id, record) in enumerate(data["records"].items()):
+                        values = vectors[row] if record.pop("has_values") else None
+                        records[_id] = {**record, "values": values}
+                    snapshot = {"version": data["corpus_version"], "records": records}
+            except (OSError, ValueError, KeyError, IndexError):
+                pass
+            _snapshots[namespace] = snapshot
+        return snapshot
 
-def get_all_context_from_pinecone() -> str:
-    """Retrieve all stored context text from Pinecone index (v4+ safe)."""
-    index = pc.Index(INDEX_NAME)
-    print("Retrieving all context from Pinecone index...")
 
-    # list() yields pages of IDs
-    id_pages = index.list()
+def _save_snapshot(namespace: str, version: str, records: Dict[str, dict]) -> None:
+    dims = {len(r["values"]) for r in records.values() if r["values"] is not None}
+    dim = dims.pop() if len(dims) == 1 else 0
+    vectors = np.zeros((len(records), dim), dtype=np.float32)
+    text_records = {}
+    for row, (_id, record) in enumerate(records.items()):
+        has_values = dim > 0 and record["values"] is not None
+        if has_values:
+            vectors[row] = record["values"]
+        text_records[_id] = {"context": record["context"], "source": record["source"], "has_values": has_values}
+
+    with _snapshots_lock:
+        _snapshots[namespace] = {"version": version, "records": records}
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        base = _snapshot_path(namespace)
+        # vectors first, so a text file on disk always has its vectors next to it
+        with open(base + ".tmp.npy", "wb") as f:
+            np.save(f, vectors)
+        os.replace(base + ".tmp.npy", base + ".npy")
+        with open(base + ".tmp.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "namespace": namespace,
+                "version": SNAPSHOT_VERSION,
+                "corpus_version": version,
+                "records": text_records,
+            }, f)
+        os.replace(base + ".tmp.json", base + ".json")
+
+
+def _list_ids(index, namespace: str) -> List[str]:
     all_ids = []
-    for page in id_pages:
-        all_ids.extend(page)  # flatten each page
-
-    print(f"Found {len(all_ids)} total vectors. Fetching metadata in batches...")
-
-    context_list = []
-    batch_size = 20  # safe batch size to avoid long URLs
-
-    for i in range(0, len(all_ids), batch_size):
-        batch_ids = all_ids[i:i+batch_size]
-        try:
-            fetched = index.fetch(ids=batch_ids)
-            for _id, record in fetched.vectors.items():
-                metadata = getattr(record, "metadata", None)
-                if metadata and "context" in metadata:   # 👈 FIXED HERE
-                    context_list.append(metadata["context"])
-        except Exception as e:
-            print(f"⚠️ Error fetching batch {i//batch_size+1}: {e}")
-
-    combined_context = "\n".join(context_list)
-    print(f"✅ Retrieved {len(context_list)} text chunks.")
-    return combined_context.strip()
+    for page in index.list(namespace=namespace, limit=EXPORT_LIST_PAGE_SIZE):
+        all_ids.extend(page)
+    return all_ids
+
+
+def list_namespace(namespace: str = "") -> Tuple[str, List[str]]:
+    """
+    (version, ids) of one namespace. The version hashes the sorted chunk IDs,
+    which are content hashes, so it changes whenever the corpus content does
+    (even at an unchanged vector count); it matches the Streamlit app's
+    corpus fingerprint. A listing is reused for CORPUS_VERSION_TTL_SECONDS.
+    """
+    now = time.monotonic()
+    with _snapshots_lock:
+        listing = _listings.get(namespace)
+    if listing is not None and now - listing[0] < CORPUS_VERSION_TTL_SECONDS:
+        return listing[1], listing[2]
+    ids = _list_ids(get_index(), namespace)
+    version = hashlib.sha256("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+    with _snapshots_lock:
+        _listings[namespace] = (now, version, ids)
+    return version, ids
+
+
+def namespace_version(namespace: str = "") -> str:
+    """Content version of one namespace (see list_namespace)"""
+    return list_namespace(namespace)[0]
+
+
+def _fetch_records(index, namespace: str, ids: List[str]) -> Dict[str, dict]:
+    fetched = index.fetch(ids=ids, namespace=namespace)
+    records = {}
+    for _id, record in fetched.vectors.items():
+        metadata = getattr(record, "metadata", None)
+        if metadata and "context" in metadata:
+            values = getattr(record, "values", None)
+            records[_id] = {
+                "context": metadata["context"],
+                "source": metadata.get("source", ""),
+                "values": np.asarray(values, dtype=np.float32) if values else None,
+            }
+    return records
+
+
+def iter_records_from_pinecone(namespace: str = "") -> Iterator[dict]:
+    """
+    Stream every stored chunk of one namespace (corpus) as an
+    {"id", "context", "source", "values"} record, values being its dense vector.
+    The namespace's IDs are listed (see list_namespace); while their version
+    matches the local snapshot's, chunks come from the snapshot. Otherwise only
+    IDs missing from the snapshot are fetched, in parallel batches, yielding
+    chunks as they arrive. Chunk IDs are content hashes, so an unchanged ID
+    means unchanged text.
+    """
+    version, all_ids = list_namespace(namespace)
+    snapshot = _load_snapshot(namespace)
+    if snapshot["version"] == version:
+        print(f"Serving {len(snapshot['records'])} chunks of namespace '{namespace}' from the local snapshot.")
+        for _id, record in snapshot["records"].items():
+            yield {"id": _id, **record}
+        return
+
+    print(f"Retrieving all context from Pinecone namespace '{namespace}'...")
+    index = get_index()
+    cached = snapshot["records"]
+    records = {_id: cached[_id] for _id in all_ids if _id in cached}
+    missing = [_id for _id in all_ids if _id not in cached]
+    print(f"Found {len(all_ids)} total vectors, {len(missing)} not in the snapshot. Fetching in parallel batches...")
+
+    for _id, record in list(records.items()):
+        yield {"id": _id, **record}
+
+    batches = [missing[i:i + EXPORT_FETCH_BATCH_SIZE] for i in range(0, len(missing), EXPORT_FETCH_BATCH_SIZE)]
+    complete = True
+    with ThreadPoolExecutor(max_workers=EXPORT_CONCURRENCY) as pool:
+        futures = {pool.submit(_fetch_records, index, namespace, batch): n for n, batch in enumerate(batches, 1)}
+        for future in as_completed(futures):
+            try:
+                fetched = future.result()
+            except Exception as e:
+                complete = False
+                print(f"⚠️ Error fetching batch {futures[future]}: {e}")
+                continue
+            records.update(fetched)
+            for _id, record in fetched.items():
+                yield {"id": _id, **record}
+
+    # a partial export would hide the failed batches behind an unchanged version
+    if complete:
+        _save_snapshot(namespace, version, records)
+    print(f"✅ Retrieved {len(records)} text chunks.")
+
+
+def iter_context_from_pinecone(namespace: str = "") -> Iterator[str]:
+    """Stream the context text of every stored chunk of one namespace (corpus)."""
+    for record in iter_records_from_pinecone(namespace):
+        yield record["context"]
+
+
+def get_all_context_from_pinecone(namespace: str = "") -> str:
+    """Retrieve all stored context text from one namespace (corpus) of the Pinecone index."""
+    return "\n".join(iter_context_from_pinecone(namespace)).strip()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+import re
+from typing import List, Literal
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+OPTION_LETTERS = ("A", "B", "C", "D")
+
+# "A. ", "(a) ", "B) ", "c: " -- the letter, then ".", ")" or ":", then whitespace (so "B-tree" is text)
+_LABEL_RES = {
+    letter: re.compile(rf"^\(?{letter}\s*[.):](?:\s+|$)", re.IGNORECASE) for letter in OPTION_LETTERS
+}
+_ANSWER_RE = re.compile(r"^\(?([A-Da-d])\)?(?:$|[\s.:\-])")
+
+
+def _strip_label(option: str, letter: str) -> str:
+    """Option text without its label, removed only when it is the label expected at that position"""
+    return _LABEL_RES[letter].sub("", option.strip(), count=1)
+
+
+class MCQ(BaseModel):
+    """One multiple-choice question as served to the exam frontend"""
+
+    question: str = Field(min_length=1)
+    options: List[str] = Field(min_length=4, max_length=4)  # "A. ...", "B. ...", ...
+    answer: Literal["A", "B", "C", "D"]
+
+    @model_validator(mode="before")
+    @classmethod
+    def _normalize_answer(cls, data):
+        """Accept answers given as "b", "(B)", "B. text" or the option text itself"""
+        if not isinstance(data, dict) or not isinstance(data.get("answer"), str):
+            return data
+        answer = data["answer"].strip()
+        options = data.get("options")
+        if isinstance(options, list):
+            for letter, option in zip(OPTION_LETTERS, options):
+                if isinstance(option, str) and answer.lower() in (option.strip().lower(), _strip_label(option, letter).lower()):
+                    return {**data, "answer": letter}
+        match = _ANSWER_RE.match(answer)
+        return {**data, "answer": match.group(1).upper() if match else answer}
+
+    @field_validator("question")
+    @classmethod
+    def _strip_question(cls, question: str) -> str:
+        question = question.strip()
+        if not question:
+            raise ValueError("empty question")
+        return question
+
+    @field_validator("options")
+    @classmethod
+    def _label_options(cls, options: List[str]) -> List[str]:
+        """The frontend reads each option's letter from its first character, so make sure it is there"""
+        labelled = []
+        for letter, option in zip(OPTION_LETTERS, options):
+            text = _strip_label(option, letter)
+            if not text:
+                raise ValueError("empty option")
+            labelled.append(f"{letter}. {text}")
+        return labelled
+
+
+class QuestionsResponse(BaseModel):
+    questions: List[MCQ]
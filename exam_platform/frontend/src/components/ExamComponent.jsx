@@ -17,18 +17,23 @@ function ExamComponent() {
   const fetchQuestions = async () => {
     try {
       setLoading(true);
-      const response = await axios.post("http://127.0.0.1:8000/generate-questions")
+      const corpus = new URLSearchParams(window.location.search).get("corpus") || "";
+      // stable per-browser ID, so retakes are not served questions already seen
+      let student = localStorage.getItem("studentId");
+      if (!student) {
+        student = crypto.randomUUID();
+        localStorage.setItem("studentId", student);
+      }
+      const response = await axios.post("http://127.0.0.1:8000/generate-questions", null, {
+        params: { corpus, student },
+      });
 
       console.log(response.data)
       if (!response.status === 200) {
         throw new Error('Failed to fetch questions');
       }
 
-      const raw = response.data.questions;
-
-      console.log(raw)
-     
-      const data = JSON.parse(raw);
+      const data = response.data.questions;
       setQuestions(data);
       setLoading(false);
     } catch (err) {
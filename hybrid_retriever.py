@@ -0,0 +1,74 @@
+# hybrid_retriever.py
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+from langchain_community.retrievers import PineconeHybridSearchRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from pinecone_text.hybrid import hybrid_convex_scale
+
+
+class NamespacedHybridRetriever(PineconeHybridSearchRetriever):
+    """
+    PineconeHybridSearchRetriever scoped to one index namespace (one corpus).
+    Returned documents carry the vector ID and match score in their metadata.
+    """
+
+    namespace: Optional[str] = None
+
+    def _query(self, dense_vec, sparse_vec) -> List[Document]:
+        dense_vec, sparse_vec = hybrid_convex_scale(dense_vec, sparse_vec, self.alpha)
+        sparse_vec["values"] = [float(v) for v in sparse_vec["values"]]
+
+        result = self.index.query(
+            vector=dense_vec,
+            sparse_vector=sparse_vec,
+            top_k=self.top_k,
+            include_metadata=True,
+            namespace=self.namespace,
+        )
+        docs = []
+        for res in result["matches"]:
+            metadata = dict(res["metadata"])
+            context = metadata.pop(self.text_key)
+            metadata["id"] = res["id"]
+            metadata["score"] = res["score"]
+            docs.append(Document(page_content=context, metadata=metadata))
+        return docs
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        sparse_vec = self.sparse_encoder.encode_queries(query)
+        dense_vec = self.embeddings.embed_query(query)
+        return self._query(dense_vec, sparse_vec)
+
+    def retrieve_many(self, queries: Sequence[str]) -> List[List[Document]]:
+        """
+        Retrieve for several queries at once: the queries are dense-embedded in
+        one batch and BM25-encoded in one call, then the index queries are
+        issued concurrently. Returns one document list per query, in order.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        dense_vecs = self.embeddings.embed_documents(queries)
+        sparse_vecs = self.sparse_encoder.encode_queries(queries)
+        if len(queries) == 1:
+            return [self._query(dense_vecs[0], sparse_vecs[0])]
+        with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+            return list(pool.map(self._query, dense_vecs, sparse_vecs))
+
+
+def merge_results(results: Sequence[List[Document]]) -> List[Document]:
+    """
+    Union of several queries' results, de-duplicated by vector ID and ordered
+    by each chunk's best score across the queries.
+    """
+    best = {}
+    for docs in results:
+        for doc in docs:
+            key = doc.metadata.get("id", doc.page_content)
+            kept = best.get(key)
+            if kept is None or doc.metadata.get("score", 0.0) > kept.metadata.get("score", 0.0):
+                best[key] = doc
+    return sorted(best.values(), key=lambda doc: doc.metadata.get("score", 0.0), reverse=True)
@@ -1,12 +1,97 @@
-from langchain_groq import ChatGroq
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from pinecone_text.sparse import BM25Encoder
-from config import GROQ_API_KEY, LLM_MODEL, EMBEDDINGS_MODEL
+import atexit
+import logging
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from embedding_cache import get_embedding_cache
+from model_registry import get_resource, get_sentence_model, get_llm
+from config import EMBEDDINGS_MODEL, EMBED_BATCH_SIZE, EMBED_NUM_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingEngine(Embeddings):
+    """
+    CPU dense embedder around a SentenceTransformer, producing unit-length vectors.
+    Texts are length-sorted to minimise padding, encoded in large batches
+    (optionally across a multi-process pool) and throughput is recorded.
+    """
+
+    def __init__(self, model, model_name=EMBEDDINGS_MODEL, batch_size=EMBED_BATCH_SIZE,
+                 num_workers=EMBED_NUM_WORKERS):
+        self.model = model
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self._pool = None
+        self.total_texts = 0
+        self.total_seconds = 0.0
+        self.last_throughput = 0.0
+
+    @property
+    def throughput(self):
+        """Average chunks/sec over every encode call so far"""
+        return self.total_texts / self.total_seconds if self.total_seconds else 0.0
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.num_workers)
+            atexit.register(self.model.stop_multi_process_pool, self._pool)
+        return self._pool
+
+    def encode(self, texts):
+        """Encode texts into a float32 matrix, rows in input order; cached texts are not re-encoded"""
+        dim = self.model.get_sentence_embedding_dimension()
+        if not texts:
+            return np.zeros((0, dim), dtype=np.float32)
+        cache = get_embedding_cache(self.model_name, dim)
+        if cache is None:
+            return self._encode_uncached(texts)
+        return cache.encode(texts, self._encode_uncached)
+
+    def _encode_uncached(self, texts):
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+
+        start = time.perf_counter()
+        if self.num_workers > 1 and len(texts) >= self.batch_size * self.num_workers:
+            vectors = self.model.encode_multi_process(
+                sorted_texts, self._get_pool(), batch_size=self.batch_size, normalize_embeddings=True
+            )
+        else:
+            vectors = self.model.encode(
+                sorted_texts, batch_size=self.batch_size, convert_to_numpy=True,
+                normalize_embeddings=True, show_progress_bar=False,
+            )
+        elapsed = time.perf_counter() - start
+
+        self.total_texts += len(texts)
+        self.total_seconds += elapsed
+        self.last_throughput = len(texts) / elapsed if elapsed else 0.0
+        logger.info("Embedded %d texts in %.2fs (%.1f chunks/sec)", len(texts), elapsed, self.last_throughput)
+
+        result = np.empty_like(vectors, dtype=np.float32)
+        result[order] = vectors
+        return result
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+
+def get_embeddings():
+    """Shared EmbeddingEngine over the registry's MiniLM model"""
+    return get_resource("embeddings", lambda: EmbeddingEngine(get_sentence_model()))
+
 
 def setup_llm():
-    """Initialize the LLM and embeddings"""
-    llm = ChatGroq(groq_api_key=GROQ_API_KEY, model_name=LLM_MODEL)
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL)
-    bm25_encoder = BM25Encoder().default()
+    """
+    Initialize the LLM and embeddings (loaded once per process, then reused).
+    Sparse encoders are per corpus (see bm25_state), so none is built here.
+    """
+    llm = get_llm()
+    embeddings = get_embeddings()
     
-    return llm, embeddings, bm25_encoder
\ No newline at end of file
+    return llm, embeddings
@@ -6,15 +6,23 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config import *
-from pinecone_setup import initialize_pinecone
-from llmembedding_setup import setup_llm
-from document_processor import process_uploaded_files
+from pipeline import get_pipeline
+from bm25_state import get_corpus_bm25, new_corpus_id, is_valid_corpus_id
+from document_processor import process_uploaded_files, corpus_fingerprint
 from prompts import topics_prompt, future_qs_prompt, get_explanation_prompt
 from ui_components import *
 
-# Initialize components
-index = initialize_pinecone()
-llm, embeddings, bm25_encoder = setup_llm()
+# Initialize components (connected once per process, chains built once per session)
+pipeline = get_pipeline()
+index, embeddings = pipeline.index, pipeline.embeddings
+
+# Each browser session works on its own corpus, resumable through the ?corpus= URL parameter
+if "corpus_id" not in st.session_state:
+    corpus_id = st.query_params.get("corpus")
+    if not is_valid_corpus_id(corpus_id):
+        corpus_id = new_corpus_id()
+        st.query_params["corpus"] = corpus_id
+    st.session_state.corpus_id = corpus_id
 
 # Streamlit UI
 st.title("📚 One Shot - Last Minute Exam Preparation Platform")
@@ -32,10 +40,16 @@ def process_files(uploaded_files):
     """Callback function to process uploaded files"""
     with st.spinner("Processing documents..."):
         try:
-            retriever, chunks = process_uploaded_files(uploaded_files, embeddings, bm25_encoder, index)
-            st.session_state.retriever = retriever
+            corpus_bm25 = get_corpus_bm25(st.session_state.corpus_id)
+            retriever, chunks = process_uploaded_files(
+                uploaded_files, embeddings, corpus_bm25, index, namespace=st.session_state.corpus_id
+            )
+            st.session_state.corpus_bm25 = corpus_bm25
+            pipeline.set_corpus(retriever, corpus_fingerprint(st.session_state.corpus_id))
             st.session_state.chunks = chunks
             st.success("✅ Documents processed and embedded successfully!")
+            if embeddings.throughput:
+                st.caption(f"Dense embedding throughput: {embeddings.throughput:.1f} chunks/sec")
             st.balloons()
             return True
         except Exception as e:
@@ -45,23 +59,28 @@ def process_files(uploaded_files):
 render_processing_button(uploaded_files, process_files)
 
 # Main interaction section
-if "retriever" in st.session_state:
+if pipeline.retriever is not None:
     st.divider()
     st.header("📝 Ask About Your Materials")
     
     query = st.text_input("What would you like to know? (e.g., 'important topics', 'potential questions')")
     
+    # Everything at once: topics, questions and both explanations run concurrently
+    render_full_report(pipeline, topics_prompt, future_qs_prompt, get_explanation_prompt)
+    
+    st.divider()
+    
     # Topic analysis
-    topics_response = render_topic_analysis(st.session_state.retriever, llm, topics_prompt)
+    topics_response = render_topic_analysis(pipeline, topics_prompt)
     if topics_response:
-        render_explanation(topics_response, llm, "topics", get_explanation_prompt)
+        render_explanation(topics_response, pipeline, "topics", get_explanation_prompt)
     
     st.divider()
     
     # Question prediction
-    questions_response = render_question_prediction(st.session_state.retriever, llm, future_qs_prompt)
+    questions_response = render_question_prediction(pipeline, future_qs_prompt)
     if questions_response:
-        render_explanation(questions_response, llm, "questions", get_explanation_prompt)
+        render_explanation(questions_response, pipeline, "questions", get_explanation_prompt)
     
     # System information
     st.divider()
@@ -0,0 +1,38 @@
+# model_registry.py
+import threading
+import torch
+from langchain_groq import ChatGroq
+from sentence_transformers import SentenceTransformer
+from config import GROQ_API_KEY, LLM_MODEL, EMBEDDINGS_MODEL, EMBED_NUM_THREADS
+
+# Process-wide singletons, created on first use and shared by every Streamlit session
+_resources = {}
+_lock = threading.RLock()
+
+
+def get_resource(name, factory):
+    """Return the instance registered under name, calling factory() only the first time"""
+    resource = _resources.get(name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(name)
+            if resource is None:
+                resource = factory()
+                _resources[name] = resource
+    return resource
+
+
+def _load_sentence_model():
+    if EMBED_NUM_THREADS:
+        torch.set_num_threads(EMBED_NUM_THREADS)
+    return SentenceTransformer(EMBEDDINGS_MODEL, device="cpu")
+
+
+def get_sentence_model():
+    """Shared MiniLM model used by ingestion, retrieval and SUMMARIA metrics"""
+    return get_resource("sentence_model", _load_sentence_model)
+
+
+def get_llm():
+    """Shared Groq chat client"""
+    return get_resource("llm", lambda: ChatGroq(groq_api_key=GROQ_API_KEY, model_name=LLM_MODEL))
@@ -0,0 +1,75 @@
+# response_cache.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from config import RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS
+from model_registry import get_resource
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def model_id(llm):
+    """Name and sampling settings of a chat model, as they affect its output"""
+    name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+    return f"{name}@{getattr(llm, 'temperature', '')}"
+
+
+def response_cache_key(corpus_fingerprint, prompt, llm, context_ids, extra=""):
+    """
+    Cache key for an LLM response: corpus, prompt template, model, the IDs of
+    the retrieved chunks and the remaining prompt input (`extra`, e.g. the
+    query or the answer being explained).
+    """
+    return _digest(corpus_fingerprint, prompt.pretty_repr(), model_id(llm), extra, *sorted(str(cid) for cid in context_ids))
+
+
+class ResponseCache:
+    """
+    In-process LLM response cache shared by every Streamlit session.
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted beyond `capacity`.
+    """
+
+    def __init__(self, capacity=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if entry[0] <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, key):
+        """Cached value for key, else None"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+def get_response_cache():
+    """Process-wide response cache, or None when caching is disabled (RESPONSE_CACHE_MAX_ENTRIES = 0)"""
+    if RESPONSE_CACHE_MAX_ENTRIES <= 0:
+        return None
+    return get_resource("response_cache", ResponseCache)
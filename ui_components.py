@@ -1,6 +1,111 @@
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import streamlit as st
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
+from response_cache import get_response_cache, response_cache_key
+from config import ANALYSIS_MAX_WORKERS
+
+def _stream_answer(document_chain, response):
+    """Yield answer tokens as the LLM produces them, collecting the full text into response['answer']"""
+    response['answer'] = ""
+    for token in document_chain.stream(response):
+        response['answer'] += token
+        yield token
+
+def _build_explanation_chain(explanation_prompt, llm):
+    return explanation_prompt, explanation_prompt | llm
+
+def _stream_explanation(explanation_chain, inputs, result):
+    result['text'] = ""
+    for chunk in explanation_chain.stream(inputs):
+        result['text'] += chunk.content
+        yield chunk.content
+
+def _write_stream(tokens, spinner_text):
+    """Show a spinner until the first token arrives, then stream the rest into the page"""
+    with st.spinner(spinner_text):
+        first = next(tokens, "")
+    return st.write_stream(itertools.chain([first], tokens))
+
+def _run_analysis(pipeline, name, prompt, query, spinner_text):
+    """
+    Render the answer to query over the pipeline's context for it: replayed
+    from the shared response cache when the same corpus, prompt, model and
+    context were answered before, streamed from the LLM otherwise.
+    Returns {'input', 'context', 'answer'} like a retrieval chain.
+    """
+    cache = get_response_cache() if pipeline.corpus_fingerprint else None
+    with st.spinner(spinner_text):
+        context = pipeline.context_for(query)
+        if cache is not None:
+            key = response_cache_key(
+                pipeline.corpus_fingerprint, prompt, pipeline.llm, [doc.metadata.get('id') for doc in context],
+                extra=query,
+            )
+            cached = cache.get(key)
+            if cached is not None:
+                st.write(cached['answer'])
+                return {'input': query, **cached}
+
+    response = {'input': query, 'context': context}
+    document_chain = pipeline.chain(name, lambda: create_stuff_documents_chain(pipeline.llm, prompt))
+    _write_stream(_stream_answer(document_chain, response), spinner_text)
+    if cache is not None:
+        cache.put(key, {'context': context, 'answer': response['answer']})
+    return response
+
+def _answer(pipeline, name, prompt, query, context):
+    """
+    Non-streaming _run_analysis over the given context, for worker
+    threads: touches no Streamlit element and waits for the LLM rate limiter.
+    """
+    cache = get_response_cache() if pipeline.corpus_fingerprint else None
+    if cache is not None:
+        key = response_cache_key(
+            pipeline.corpus_fingerprint, prompt, pipeline.llm, [doc.metadata.get('id') for doc in context],
+            extra=query,
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            return {'input': query, **cached}
+
+    document_chain = pipeline.chain(name, lambda: create_stuff_documents_chain(pipeline.llm, prompt))
+    pipeline.rate_limiter.wait()
+    answer = document_chain.invoke({'input': query, 'context': context})
+    if cache is not None:
+        cache.put(key, {'context': context, 'answer': answer})
+    return {'input': query, 'context': context, 'answer': answer}
+
+def _explanation_setup(response, pipeline, answer_type, get_explanation_prompt_func):
+    """(chain, inputs, cache, key) for explaining response; cache is None when caching is off"""
+    explanation_prompt, explanation_chain = pipeline.chain(
+        f"explain_{answer_type}",
+        lambda: _build_explanation_chain(get_explanation_prompt_func(answer_type), pipeline.llm)
+    )
+    context_docs = "\n---\n".join([doc.page_content[:500] + "..." for doc in response["context"]])
+    inputs = {"answer": response['answer'], "context": context_docs}
+    cache = get_response_cache() if pipeline.corpus_fingerprint else None
+    key = None
+    if cache is not None:
+        key = response_cache_key(
+            pipeline.corpus_fingerprint, explanation_prompt, pipeline.llm,
+            [doc.metadata.get('id') for doc in response["context"]], extra=response['answer']
+        )
+    return explanation_chain, inputs, cache, key
+
+def _explain(response, pipeline, answer_type, get_explanation_prompt_func):
+    """Explanation text for response, without Streamlit calls (safe in worker threads)"""
+    explanation_chain, inputs, cache, key = _explanation_setup(
+        response, pipeline, answer_type, get_explanation_prompt_func
+    )
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return cached
+    pipeline.rate_limiter.wait()
+    text = explanation_chain.invoke(inputs).content
+    if cache is not None:
+        cache.put(key, text)
+    return text
 
 def render_file_upload():
     """Render file upload component"""
@@ -19,53 +124,102 @@ def render_processing_button(uploaded_files, process_callback):
             return process_callback(uploaded_files)
     return None
 
-def render_topic_analysis(retriever, llm, topics_prompt):
+def render_topic_analysis(pipeline, topics_prompt):
     """Render topic analysis section"""
     if st.button("Get Important Topics"):
-        with st.spinner("Analyzing for key topics..."):
-            try:
-                document_chain = create_stuff_documents_chain(llm, topics_prompt)
-                retrieval_chain = create_retrieval_chain(retriever, document_chain)
-                response = retrieval_chain.invoke({'input': "important topics"})
-                
-                st.subheader("📌 Key Topics to Focus On")
-                st.write(response['answer'])
-                
-                return response
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                return None
+        try:
+            st.subheader("📌 Key Topics to Focus On")
+            return _run_analysis(pipeline, "topics", topics_prompt, "important topics", "Analyzing for key topics...")
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+            return None
 
-def render_question_prediction(retriever, llm, future_qs_prompt):
+def render_question_prediction(pipeline, future_qs_prompt):
     """Render question prediction section"""
     if st.button("Predict Exam Questions"):
-        with st.spinner("Analyzing for potential questions..."):
-            try:
-                document_chain = create_stuff_documents_chain(llm, future_qs_prompt)
-                retrieval_chain = create_retrieval_chain(retriever, document_chain)
-                response = retrieval_chain.invoke({'input': "future questions"})
-                
-                st.subheader("🔮 Predicted Exam Questions")
-                st.write(response['answer'])
-                
-                return response
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                return None
+        try:
+            st.subheader("🔮 Predicted Exam Questions")
+            return _run_analysis(
+                pipeline, "questions", future_qs_prompt, "future questions", "Analyzing for potential questions..."
+            )
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+            return None
+
+def render_full_report(pipeline, topics_prompt, future_qs_prompt, get_explanation_prompt_func):
+    """
+    "Analyse everything": fetch the shared context once and rerank it per
+    prompt, then run the topic and question prompts and both explanations
+    concurrently (at most ANALYSIS_MAX_WORKERS calls in flight, paced by the
+    LLM rate limiter), rendering each panel as soon as it is ready. Worker threads never touch
+    Streamlit; all rendering happens here on the script thread.
+    """
+    if not st.button("⚡ Analyse Everything"):
+        return None
+
+    lanes = {
+        "topics": ("📌 Key Topics to Focus On", topics_prompt, "important topics"),
+        "questions": ("🔮 Predicted Exam Questions", future_qs_prompt, "future questions")
+    }
+    try:
+        with st.spinner("Retrieving context..."):
+            contexts = {kind: pipeline.context_for(query) for kind, (_, _, query) in lanes.items()}
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
+        return None
+
+    # Lay out every panel up front so they keep their order whatever finishes first
+    panels = {}
+    for kind, (title, _, _) in lanes.items():
+        st.subheader(title)
+        answer_box = st.empty()
+        answer_box.info("⏳ Working...")
+        panels[kind] = (answer_box, st.empty())
+
+    responses = {}
+    with ThreadPoolExecutor(max_workers=ANALYSIS_MAX_WORKERS) as pool:
+        pending = {
+            pool.submit(_answer, pipeline, kind, prompt, query, contexts[kind]): ('answer', kind)
+            for kind, (_, prompt, query) in lanes.items()
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                step, kind = pending.pop(future)
+                answer_box, details = panels[kind]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    (answer_box if step == 'answer' else details).error(f"An error occurred: {str(e)}")
+                    continue
+                if step == 'answer':
+                    responses[kind] = result
+                    answer_box.markdown(result['answer'])
+                    details.info("⏳ Explaining...")
+                    pending[pool.submit(_explain, result, pipeline, kind, get_explanation_prompt_func)] = ('explanation', kind)
+                else:
+                    with details.container():
+                        render_explanation(responses[kind], pipeline, kind, get_explanation_prompt_func, explanation=result)
+    return responses
 
-def render_explanation(response, llm, answer_type, get_explanation_prompt_func):
-    """Render explanation section"""
+def render_explanation(response, pipeline, answer_type, get_explanation_prompt_func, explanation=None):
+    """Render explanation section (explanation: precomputed text, if any)"""
     if response:
         with st.expander("🔍 How these topics were identified" if answer_type == "topics" else "🔍 How these predictions were made"):
-            explanation_prompt = get_explanation_prompt_func(answer_type)
-            
-            context_docs = "\n---\n".join([doc.page_content[:500] + "..." for doc in response["context"]])
-            explanation_chain = explanation_prompt | llm
-            explanation = explanation_chain.invoke({
-                "answer": response['answer'],
-                "context": context_docs
-            })
-            st.write(explanation.content)
+            if explanation is None:
+                explanation_chain, inputs, cache, key = _explanation_setup(
+                    response, pipeline, answer_type, get_explanation_prompt_func
+                )
+                explanation = cache.get(key) if cache is not None else None
+                if explanation is None:
+                    result = {}
+                    st.write_stream(_stream_explanation(explanation_chain, inputs, result))
+                    if cache is not None:
+                        cache.put(key, result['text'])
+                else:
+                    st.write(explanation)
+            else:
+                st.write(explanation)
         
         # Source materials
         with st.expander("📚 Relevant Source Materials"):
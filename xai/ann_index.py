@@ -0,0 +1,140 @@
+# ann_index.py
+import os
+import numpy as np
+from config import ANN_NLIST, ANN_NPROBE, ANN_MIN_TRAIN_SIZE, ANN_RETRAIN_FACTOR
+
+
+def _nearest(vectors, centroids, block=4096):
+    """Index of the highest inner-product centroid for every vector (computed in blocks)"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block):
+        labels[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+    return labels
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index for inner-product search.
+    Rows are bucketed under the nearest of `nlist` spherical k-means centroids and
+    a query only scans the `nprobe` best buckets; raise nprobe for recall, lower
+    it for latency. Vectors stay in the caller's matrix: the index only keeps
+    centroids and a row -> bucket assignment.
+    """
+
+    def __init__(self, nlist=ANN_NLIST, nprobe=ANN_NPROBE, min_train_size=ANN_MIN_TRAIN_SIZE,
+                 retrain_factor=ANN_RETRAIN_FACTOR):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.centroids = None
+        self.assign = np.full(0, -1, dtype=np.int32)  # row -> bucket, -1 when not indexed
+        self.trained_size = 0
+        self._order = None
+        self._offsets = None
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def _ensure_rows(self, n_rows):
+        if len(self.assign) < n_rows:
+            self.assign = np.concatenate([self.assign, np.full(n_rows - len(self.assign), -1, dtype=np.int32)])
+
+    def train(self, matrix, rows, iters=10, seed=0):
+        """Fit spherical k-means centroids on the given rows and (re)assign all of them"""
+        rows = np.asarray(rows, dtype=np.int64)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(rows))))
+        nlist = min(nlist, len(rows))
+        rng = np.random.default_rng(seed)
+
+        sample_rows = rows if len(rows) <= nlist * 32 else rng.choice(rows, nlist * 32, replace=False)
+        sample = _normalize(np.asarray(matrix[np.sort(sample_rows)], dtype=np.float32))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iters):
+            labels = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():  # re-seed empty buckets from random sample points
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        self.centroids = centroids
+        self.trained_size = len(rows)
+        self.assign[:] = -1
+        self.add(matrix, rows)
+
+    def add(self, matrix, rows):
+        """Assign newly inserted (or overwritten) rows to their buckets"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        self._ensure_rows(int(rows.max()) + 1)
+        if self.is_trained:
+            self.assign[rows] = _nearest(np.asarray(matrix[rows], dtype=np.float32), self.centroids)
+            self._order = None
+
+    def remove(self, rows):
+        rows = np.asarray(list(rows), dtype=np.int64)
+        if len(rows):
+            self._ensure_rows(int(rows.max()) + 1)
+            self.assign[rows] = -1
+            self._order = None
+
+    def maybe_train(self, matrix, live_rows):
+        """Train once the corpus is large enough, and retrain after it has grown retrain_factor-fold"""
+        n_live = len(live_rows)
+        if n_live < self.min_train_size:
+            return False
+        if self.is_trained and n_live < self.retrain_factor * self.trained_size:
+            return False
+        self.train(matrix, live_rows)
+        return True
+
+    def _buckets(self):
+        if self._order is None:
+            self._order = np.argsort(self.assign, kind="stable").astype(np.int64)
+            self._offsets = np.searchsorted(self.assign[self._order], np.arange(-1, len(self.centroids) + 1))
+        return self._order, self._offsets
+
+    def search(self, query, nprobe=None):
+        """Candidate rows from the nprobe buckets whose centroids best match the query"""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ np.asarray(query, dtype=np.float32)
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        order, offsets = self._buckets()
+        # offsets[0] is the start of the unassigned (-1) block, so bucket b spans offsets[b + 1]:offsets[b + 2]
+        parts = [order[offsets[b + 1]:offsets[b + 2]] for b in probe]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids if self.is_trained else np.zeros((0, 0), dtype=np.float32),
+            assign=self.assign,
+            trained_size=np.array(self.trained_size),
+        )
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Restore a saved index; returns False if there is nothing usable on disk"""
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                centroids = data["centroids"]
+                self.centroids = centroids if centroids.size else None
+                self.assign = data["assign"].astype(np.int32)
+                self.trained_size = int(data["trained_size"])
+        except Exception:
+            return False
+        self._order = None
+        return True
@@ -0,0 +1,143 @@
+# bm25_state.py
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+from collections import Counter
+from pinecone_text.sparse import BM25Encoder
+from config import BM25_STATE_DIR
+
+_CORPUS_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+
+def new_corpus_id():
+    """Random ID for a fresh corpus (one per student workspace)"""
+    return uuid.uuid4().hex[:16]
+
+
+def is_valid_corpus_id(corpus_id):
+    return bool(corpus_id) and _CORPUS_ID_RE.fullmatch(corpus_id) is not None
+
+
+class CorpusBM25:
+    """
+    BM25 statistics for one ingested corpus.
+    Chunks are counted once (by chunk ID), so re-ingesting is free and new
+    documents update the statistics incrementally instead of refitting.
+    `encoder` is a BM25Encoder private to this corpus.
+    """
+
+    def __init__(self, corpus_id):
+        if not is_valid_corpus_id(corpus_id):
+            raise ValueError(f"Invalid corpus id: {corpus_id!r}")
+        self.corpus_id = corpus_id
+        self.doc_ids = set()
+        self.n_docs = 0
+        self.sum_doc_len = 0.0
+        self.doc_freq = Counter()
+        self.encoder = BM25Encoder()
+        self._scratch = BM25Encoder()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(BM25_STATE_DIR, f"{self.corpus_id}.json")
+
+    def add_documents(self, doc_ids, texts):
+        """Fold documents not seen before into the corpus statistics; returns how many were added"""
+        with self._lock:
+            new = {}
+            for doc_id, text in zip(doc_ids, texts):
+                if doc_id not in self.doc_ids and doc_id not in new:
+                    new[doc_id] = text
+            if not new:
+                return 0
+
+            # fit a scratch encoder on just the new documents and merge its counts
+            try:
+                self._scratch.fit(list(new.values()))
+            except ZeroDivisionError:  # none of the new documents produced any tokens
+                self._scratch.n_docs = 0
+            if self._scratch.n_docs:
+                self.n_docs += self._scratch.n_docs
+                self.sum_doc_len += self._scratch.avgdl * self._scratch.n_docs
+                self.doc_freq.update(self._scratch.doc_freq)
+            self.doc_ids.update(new)
+            self._sync_encoder()
+            return len(new)
+
+    def _sync_encoder(self):
+        self.encoder.n_docs = self.n_docs
+        self.encoder.avgdl = self.sum_doc_len / self.n_docs if self.n_docs else 0.0
+        self.encoder.doc_freq = dict(self.doc_freq)
+
+    def save(self):
+        """
+        Persist the statistics so the corpus can be resumed without refitting.
+        Saves are serialised, so an older snapshot never replaces a newer one.
+        """
+        os.makedirs(BM25_STATE_DIR, exist_ok=True)
+        with self._save_lock:
+            with self._lock:
+                data = {
+                    "corpus_id": self.corpus_id,
+                    "doc_ids": sorted(self.doc_ids),
+                    "n_docs": self.n_docs,
+                    "sum_doc_len": self.sum_doc_len,
+                    "doc_freq": {"indices": list(self.doc_freq), "values": list(self.doc_freq.values())},
+                }
+            fd, tmp_path = tempfile.mkstemp(dir=BM25_STATE_DIR, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    @classmethod
+    def load(cls, corpus_id):
+        """Load saved statistics for corpus_id, or start an empty corpus"""
+        state = cls(corpus_id)
+        if os.path.exists(state.path):
+            try:
+                with open(state.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                state.doc_ids = set(data["doc_ids"])
+                state.n_docs = data["n_docs"]
+                state.sum_doc_len = data["sum_doc_len"]
+                state.doc_freq = Counter(dict(zip(data["doc_freq"]["indices"], data["doc_freq"]["values"])))
+                state._sync_encoder()
+            except Exception:
+                state = cls(corpus_id)
+        return state
+
+
+def get_corpus_bm25(corpus_id):
+    """Cached per-corpus BM25 state, loaded from disk the first time it is requested"""
+    with _corpora_lock:
+        state = _corpora.get(corpus_id)
+        if state is None:
+            state = CorpusBM25.load(corpus_id)
+            _corpora[corpus_id] = state
+        return state
+
+
+def drop_corpus_bm25(corpus_id=None):
+    """Forget one corpus (or all of them), in memory and on disk"""
+    with _corpora_lock:
+        ids = [corpus_id] if corpus_id else list(_corpora)
+        if not corpus_id and os.path.isdir(BM25_STATE_DIR):
+            ids += [name[:-5] for name in os.listdir(BM25_STATE_DIR) if name.endswith(".json")]
+        for cid in set(ids):
+            _corpora.pop(cid, None)
+            if is_valid_corpus_id(cid):
+                path = os.path.join(BM25_STATE_DIR, f"{cid}.json")
+                if os.path.exists(path):
+                    os.remove(path)
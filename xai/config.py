@@ -8,7 +8,46 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 INDEX_NAME = "one-shot-hybrid"
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")  # "pinecone" or "local" (offline)
+LOCAL_STORE_DIR = ".local_index"  # where the local backend keeps its vectors
+ANN_MIN_TRAIN_SIZE = 20_000  # local backend: exact search below this many vectors, IVF above
+ANN_NLIST = 0  # IVF buckets; 0 picks ~4*sqrt(N)
+ANN_NPROBE = 8  # buckets scanned per query: higher = better recall, lower = faster
+ANN_RETRAIN_FACTOR = 4  # retrain the IVF centroids once the corpus grows this many times
 EMBEDDINGS_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 LLM_MODEL = "openai/gpt-oss-20b"
 CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
\ No newline at end of file
+CHUNK_OVERLAP = 200
+
+# Ingestion
+INGEST_MANIFEST_DIR = ".ingest_manifest"  # local records of what is already in the index
+INGEST_WORKERS = max(1, (os.cpu_count() or 1) - 1)  # parser processes; 1 parses in-process
+INGEST_BATCH_SIZE = 256  # chunks per dense-embedding batch
+UPSERT_BATCH_SIZE = 100  # vectors per upsert request
+UPSERT_CONCURRENCY = 4  # upsert requests in flight at once
+UPSERT_MAX_RETRIES = 4  # retries per batch on transient failures
+UPSERT_BACKOFF_SECONDS = 0.5  # base delay, doubled on every retry
+
+# Dense embedding
+EMBED_BATCH_SIZE = 128  # texts per forward pass
+EMBED_NUM_THREADS = os.cpu_count() or 1  # torch intra-op threads
+EMBED_NUM_WORKERS = int(os.getenv("EMBED_NUM_WORKERS", "1"))  # >1 encodes large inputs in a process pool
+EMBEDDING_CACHE_DIR = ".embedding_cache"  # persistent (model, text hash) -> vector cache
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000  # LRU-evicted beyond this; 0 disables the cache
+BM25_STATE_DIR = ".bm25_state"  # per-corpus BM25 statistics
+
+# Retrieval
+RETRIEVAL_TOP_K = 12  # hybrid-search candidates per query, before reranking
+RETRIEVAL_ALPHA = 0.5  # dense/sparse weighting: 1 = dense only, 0 = sparse (BM25) only
+RERANK_TOKEN_BUDGET = 3000  # context tokens kept per prompt after MMR reranking
+RERANK_LAMBDA = 0.5  # MMR trade-off: 1 = relevance only, lower = more diverse context
+CHARS_PER_TOKEN = 4  # rough estimate used for the token budget
+ANALYSIS_QUERIES = ("important topics", "future questions")  # retrieved in one batch; their merged results feed every prompt
+
+# LLM response cache
+RESPONSE_CACHE_MAX_ENTRIES = 512  # cached answers shared by all sessions; 0 disables the cache
+RESPONSE_CACHE_TTL_SECONDS = 6 * 3600
+
+# Concurrent analysis ("Analyse Everything")
+ANALYSIS_MAX_WORKERS = 4  # LLM calls in flight at once per report
+LLM_REQUESTS_PER_MINUTE = 30  # process-wide cap on LLM calls started by reports; 0 = unlimited
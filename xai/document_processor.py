@@ -1,57 +1,557 @@
 # document_processor.py
-import tempfile
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+import posixpath
+import random
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree import ElementTree
+from urllib3.exceptions import HTTPError as TransportError
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
-from langchain_community.retrievers import PineconeHybridSearchRetriever
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from langchain_core.documents import Document
+from hybrid_retriever import NamespacedHybridRetriever
+from config import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    INDEX_NAME,
+    VECTOR_STORE_BACKEND,
+    LOCAL_STORE_DIR,
+    EMBEDDINGS_MODEL,
+    INGEST_MANIFEST_DIR,
+    INGEST_WORKERS,
+    INGEST_BATCH_SIZE,
+    UPSERT_BATCH_SIZE,
+    UPSERT_CONCURRENCY,
+    UPSERT_MAX_RETRIES,
+    UPSERT_BACKOFF_SECONDS,
+    RETRIEVAL_TOP_K,
+    RETRIEVAL_ALPHA,
+)
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+# OOXML namespaces used by the PPTX extractor
+_A_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_P_NS = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+_R_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+# -------------------------------
+# Ingestion manifest
+# -------------------------------
+# One small JSON record per parsed file (its chunks, shared by every corpus
+# that uploads the same file) and one per namespace (the chunk IDs indexed
+# there), under a directory named after the settings that produced them.
+_manifest_lock = threading.Lock()
+
+
+def _manifest_key():
+    """Settings that invalidate the manifest when changed"""
+    return {
+        "index": INDEX_NAME,
+        "backend": VECTOR_STORE_BACKEND,
+        "local_store": os.path.abspath(LOCAL_STORE_DIR),
+        "model": EMBEDDINGS_MODEL,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "layout": 3,  # one record per file and per namespace
+    }
+
+
+def _manifest_dir():
+    key = json.dumps(_manifest_key(), sort_keys=True)
+    return os.path.join(INGEST_MANIFEST_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+
+
+def _file_record_path(file_hash):
+    return os.path.join(_manifest_dir(), "files", file_hash + ".json")
+
+
+def _namespace_record_path(namespace):
+    return os.path.join(_manifest_dir(), "vectors", hashlib.sha1(namespace.encode("utf-8")).hexdigest() + ".json")
+
+
+def _read_record(path, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_record(path, data):
+    """Atomically write a record so a crash never leaves it half-written"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _fingerprint(sorted_ids):
+    return hashlib.sha256("\n".join(sorted_ids).encode("utf-8")).hexdigest()
+
+
+def load_file_record(file_hash):
+    """{"name", "chunks"} recorded for an already parsed file, or None"""
+    return _read_record(_file_record_path(file_hash))
+
+
+def save_file_record(file_hash, record):
+    # content-addressed: concurrent writers of one file write the same record
+    _write_record(_file_record_path(file_hash), record)
+
+
+def load_indexed_ids(namespace=""):
+    """Chunk IDs recorded as indexed in a namespace"""
+    return set(_read_record(_namespace_record_path(namespace), {}).get("ids", []))
+
+
+def record_indexed_ids(namespace, ids):
+    """
+    Add chunk IDs to a namespace's record. The record is re-read and merged
+    under a lock, so concurrent ingestions never drop each other's IDs.
+    """
+    with _manifest_lock:
+        path = _namespace_record_path(namespace)
+        current = set(_read_record(path, {}).get("ids", []))
+        merged = current | set(ids)
+        if merged != current:
+            merged = sorted(merged)
+            _write_record(path, {"ids": merged, "fingerprint": _fingerprint(merged)})
+
+
+def reset_ingest_manifest(namespace=None):
+    """
+    Forget what was indexed in one namespace (call after it is deleted),
+    or everything when no namespace is given.
+    """
+    with _manifest_lock:
+        if namespace is None:
+            shutil.rmtree(INGEST_MANIFEST_DIR, ignore_errors=True)
+            return
+        try:
+            os.remove(_namespace_record_path(namespace))
+        except FileNotFoundError:
+            pass
+
+
+def corpus_fingerprint(namespace=""):
+    """
+    Hash of every chunk ID indexed in a namespace. Chunk IDs are content
+    hashes, so two corpora built from the same material share a fingerprint.
+    """
+    record = _read_record(_namespace_record_path(namespace), {})
+    return record.get("fingerprint") or _fingerprint([])
+
+
+def _file_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _chunk_id(text):
+    """Content-addressed vector ID: identical chunk text always maps to the same ID"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# -------------------------------
+# Loading
+# -------------------------------
+@contextmanager
+def _temp_file(data, suffix=""):
+    """Spill bytes to a temp file for loaders that need a path; always removed on exit"""
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        yield tmp_path
+    finally:
+        os.unlink(tmp_path)
+
+
+def _load_pdf(file_name, data):
+    """Extract PDF pages straight from the upload's bytes"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    return [
+        Document(page_content=page.extract_text(), metadata={"source": file_name, "page": i})
+        for i, page in enumerate(reader.pages)
+    ]
+
+
+def _load_docx(file_name, data):
+    """Extract DOCX text straight from the upload's bytes"""
+    import docx2txt
+
+    return [Document(page_content=docx2txt.process(io.BytesIO(data)), metadata={"source": file_name})]
+
+
+def _pptx_rels(zf, rels_path):
+    """Map relationship IDs of one .rels part to (type, resolved part name)"""
+    if rels_path not in zf.NameToInfo:
+        return {}
+    base_dir = posixpath.dirname(posixpath.dirname(rels_path))
+    rels = {}
+    for rel in ElementTree.fromstring(zf.read(rels_path)).iter(f"{_REL_NS}Relationship"):
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            target = target.lstrip("/")  # absolute targets are relative to the package root
+        else:
+            target = posixpath.join(base_dir, target)
+        rels[rel.get("Id")] = (rel.get("Type", ""), posixpath.normpath(target))
+    return rels
+
+
+def _pptx_paragraphs(zf, part_name):
+    """
+    Stream the text paragraphs of one slide or notes part without building the
+    full tree. Slide-number fields are skipped: notes pages repeat the slide
+    number that way, and it is not part of the content.
+    """
+    paragraphs, runs, in_slidenum = [], [], False
+    with zf.open(part_name) as fh:
+        for event, elem in ElementTree.iterparse(fh, events=("start", "end")):
+            if elem.tag == f"{_A_NS}fld":
+                in_slidenum = event == "start" and elem.get("type") == "slidenum"
+            elif event == "start":
+                continue
+            elif elem.tag == f"{_A_NS}t":
+                if not in_slidenum:
+                    runs.append(elem.text or "")
+            elif elem.tag == f"{_A_NS}p":
+                text = "".join(runs).strip()
+                if text:
+                    paragraphs.append(text)
+                runs = []
+                elem.clear()
+    return paragraphs
+
 
-def process_uploaded_files(uploaded_files, embeddings, sparse_encoder, index):
-    """Process uploaded files and add them to Pinecone"""
+def _load_pptx(file_name, data):
+    """
+    Extract slide text and speaker notes from a PPTX, one Document per slide
+    in presentation order, tagged with its slide number.
+    """
     docs = []
-    for file in uploaded_files:
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            tmp.write(file.read())
-            tmp_path = tmp.name
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        pres_rels = _pptx_rels(zf, "ppt/_rels/presentation.xml.rels")
+        presentation = ElementTree.fromstring(zf.read("ppt/presentation.xml"))
+        slide_ids = presentation.find(f"{_P_NS}sldIdLst")
+        slide_parts = [
+            pres_rels[sld.get(f"{_R_NS}id")][1]
+            for sld in (slide_ids if slide_ids is not None else [])
+            if sld.get(f"{_R_NS}id") in pres_rels
+        ]
+
+        for number, slide_part in enumerate(slide_parts, 1):
+            if slide_part not in zf.NameToInfo:
+                continue
+            text = "\n".join(_pptx_paragraphs(zf, slide_part))
+
+            slide_rels = _pptx_rels(
+                zf, posixpath.join(posixpath.dirname(slide_part), "_rels", posixpath.basename(slide_part) + ".rels")
+            )
+            for rel_type, target in slide_rels.values():
+                if rel_type.endswith("/notesSlide") and target in zf.NameToInfo:
+                    notes = _pptx_paragraphs(zf, target)
+                    if notes:
+                        text += "\n\nSpeaker notes:\n" + "\n".join(notes)
+
+            if text.strip():
+                docs.append(Document(page_content=f"[Slide {number}]\n{text}", metadata={"source": file_name, "slide": number}))
+    return docs
+
+
+def _load_with_fallback(loader, fallback_cls, file_name, data, suffix):
+    """Parse in memory; only spill to disk if the in-memory parser is unavailable or fails"""
+    try:
+        return loader(file_name, data)
+    except Exception:
+        with _temp_file(data, suffix) as tmp_path:
+            return fallback_cls(tmp_path).load()
+
+
+def _load_documents(file_name, data):
+    """Parse one uploaded file into page Documents; returns None for unsupported types"""
+    if file_name.endswith(".pdf"):
+        docs = _load_with_fallback(_load_pdf, PyPDFLoader, file_name, data, ".pdf")
+    elif file_name.endswith(".docx"):
+        docs = _load_with_fallback(_load_docx, Docx2txtLoader, file_name, data, ".docx")
+    elif file_name.endswith(".pptx"):
+        docs = _load_pptx(file_name, data)
+    else:
+        return None
+
+    for doc in docs:
+        doc.metadata["source"] = file_name
+    return docs
+
+
+def _get_parse_pool():
+    """Lazily create the parser process pool, reused across Streamlit reruns"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # spawn rather than fork: the app process is multi-threaded (Streamlit, torch)
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pool
+
+
+def _discard_parse_pool(pool):
+    """Drop a broken pool (e.g. a worker was OOM-killed) so the next ingestion starts a fresh one"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_all(pending):
+    """Submit every pending file to the parse pool, replacing the pool once if it is already broken"""
+    for attempt in range(2):
+        pool = _get_parse_pool()
         try:
-            if file.name.endswith(".pdf"):
-                loader = PyPDFLoader(tmp_path)
-            elif file.name.endswith(".docx"):
-                loader = Docx2txtLoader(tmp_path)
-            else:
-                # support pptx and plain text fallback
-                if file.name.endswith(".pptx"):
-                    # try to load as binary text fallback
-                    with open(tmp_path, "rb") as fh:
-                        raw = fh.read().decode(errors="ignore")
-                    docs.append(type("D", (), {"page_content": raw})())
+            return pool, {
+                pool.submit(_load_documents, file_name, data): (file_hash, file_name)
+                for file_hash, (file_name, data) in pending.items()
+            }
+        except BrokenProcessPool:
+            _discard_parse_pool(pool)
+            if attempt:
+                raise
+
+
+def _iter_parsed_files(pending):
+    """
+    Yield (file_hash, file_name, docs) for each pending file as soon as it is parsed.
+    Files are parsed in a process pool when more than one worker is configured.
+    """
+    if INGEST_WORKERS <= 1 or len(pending) <= 1:
+        for file_hash, (file_name, data) in pending.items():
+            try:
+                docs = _load_documents(file_name, data)
+            except Exception as e:
+                raise Exception(f"Error processing {file_name}: {str(e)}")
+            yield file_hash, file_name, docs
+        return
+
+    pool, futures = _submit_all(pending)
+    try:
+        for future in as_completed(futures):
+            file_hash, file_name = futures[future]
+            try:
+                docs = future.result()
+            except BrokenProcessPool:
+                _discard_parse_pool(pool)
+                raise Exception(f"Error processing {file_name}: the parser process crashed (out of memory?)")
+            except Exception as e:
+                raise Exception(f"Error processing {file_name}: {str(e)}")
+            yield file_hash, file_name, docs
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _iter_batches(items, batch_size):
+    """Yield successive lists of at most batch_size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _build_vectors(sparse_encoder, batch, dense_vectors):
+    """Sparse-encode a batch of (chunk_id, Document) pairs into upsert records with their dense vectors"""
+    sparse_vectors = sparse_encoder.encode_documents([doc.page_content for _, doc in batch])
+    vectors = []
+    for (cid, doc), dense, sparse in zip(batch, dense_vectors, sparse_vectors):
+        metadata = dict(doc.metadata)
+        metadata["context"] = doc.page_content
+        vectors.append({"id": cid, "values": dense, "sparse_values": sparse, "metadata": metadata})
+    return vectors
+
+
+# connection resets, timeouts and protocol errors from the HTTP layer under the Pinecone client
+_NETWORK_ERRORS = (ConnectionError, TimeoutError, TransportError)
+
+
+def _is_transient(exc):
+    """Rate limits, server errors and network failures are worth retrying; anything else is a bug or a bad request"""
+    status = getattr(exc, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(exc, _NETWORK_ERRORS)
+
+
+class IngestWriter:
+    """
+    Upserts vectors in fixed-size batches over a bounded number of concurrent
+    requests. Transient failures are retried with exponential backoff and
+    jitter. Vector IDs are content-addressed, so retries and resumed runs are
+    idempotent. IDs of batches that landed are collected in `completed_ids`.
+    """
+
+    def __init__(self, index, namespace="", batch_size=UPSERT_BATCH_SIZE, max_in_flight=UPSERT_CONCURRENCY,
+                 max_retries=UPSERT_MAX_RETRIES, backoff=UPSERT_BACKOFF_SECONDS):
+        self.index = index
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.completed_ids = set()
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _upsert_with_retry(self, vectors):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.index.upsert(vectors=vectors, namespace=self.namespace)
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not _is_transient(e):
+                    raise
+                time.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+        with self._lock:
+            self.completed_ids.update(v["id"] for v in vectors)
+
+    def _on_done(self, future):
+        self._slots.release()
+        error = future.exception()
+        if error is not None:
+            with self._lock:
+                self._errors.append(error)
+
+    def submit(self, vectors):
+        """Queue vectors for upsert; blocks while max_in_flight requests are already running"""
+        for batch in _iter_batches(vectors, self.batch_size):
+            if self._errors:
+                break
+            self._slots.acquire()
+            self._pool.submit(self._upsert_with_retry, batch).add_done_callback(self._on_done)
+
+    def close(self):
+        """Wait for every in-flight batch; raise the first failure, if any"""
+        self._pool.shutdown(wait=True)
+        if self._errors:
+            raise Exception(f"Upsert failed after retries: {self._errors[0]}")
+
+
+def process_uploaded_files(uploaded_files, embeddings, corpus_bm25, index, namespace=""):
+    """
+    Process uploaded files and add them to the corpus' Pinecone namespace.
+    Files and chunks already recorded in the ingestion manifest are not
+    re-parsed, re-embedded or re-upserted. New files are parsed in parallel
+    and split to text first; the new chunks are then dense-embedded,
+    sparse-encoded and upserted one INGEST_BATCH_SIZE batch at a time, so
+    peak memory is set by the batch size rather than the corpus size.
+    Sparse vectors use the corpus' own BM25 statistics (a bm25_state.CorpusBM25),
+    which are updated with the new chunks rather than refitted.
+    """
+    indexed = load_indexed_ids(namespace)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    upload_hashes, records, pending = [], {}, {}
+    for file in uploaded_files:
+        # Hash through a zero-copy view; bytes are only copied for files that need parsing
+        with file.getbuffer() as buf:
+            file_hash = _file_hash(buf)
+            if file_hash not in records and file_hash not in pending:
+                record = load_file_record(file_hash)
+                if record is None:
+                    pending[file_hash] = (file.name, bytes(buf))
                 else:
-                    continue
-            if 'loader' in locals():
-                docs.extend(loader.load())
-                del loader
-            os.unlink(tmp_path)
-        except Exception as e:
-            raise Exception(f"Error processing {file.name}: {str(e)}")
-    
-    if not docs:
+                    records[file_hash] = record
+        upload_hashes.append(file_hash)
+
+    # Parse and split everything to text: pages -> chunks
+    for file_hash, file_name, docs in _iter_parsed_files(pending):
+        if docs is None:
+            continue
+        entry_chunks = []
+        # split page by page (slide by slide for PPTX) so no chunk spans two of them
+        for page in docs:
+            for chunk in splitter.split_documents([page]):
+                entry_chunks.append(
+                    {"id": _chunk_id(chunk.page_content), "text": chunk.page_content, "metadata": chunk.metadata}
+                )
+        records[file_hash] = {"name": file_name, "chunks": entry_chunks}
+        save_file_record(file_hash, records[file_hash])
+
+    chunks, chunk_ids, to_index, seen_files = [], [], {}, set()
+    for file_hash in upload_hashes:
+        entry = records.get(file_hash)
+        if entry is None or file_hash in seen_files:
+            continue
+        seen_files.add(file_hash)
+        for c in entry["chunks"]:
+            doc = Document(page_content=c["text"], metadata=dict(c["metadata"]))
+            chunks.append(doc)
+            chunk_ids.append(c["id"])
+            # new chunks, and chunks of known files that never made it into the index (e.g. an aborted run)
+            if c["id"] not in indexed:
+                to_index.setdefault(c["id"], doc)
+
+    if not chunks:
         raise Exception("No valid documents were processed")
-    
-    # Split text
-    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    chunks = splitter.split_documents(docs)
-    
-    # Fit sparse encoder
-    texts = [doc.page_content for doc in chunks]
-    sparse_encoder.fit(texts)
-    
+
+    # BM25 document vectors depend on corpus statistics, so update them before any sparse encoding
+    if corpus_bm25.add_documents(chunk_ids, [doc.page_content for doc in chunks]):
+        corpus_bm25.save()
+
+    # Embed -> sparse-encode -> upsert one batch at a time; submit() blocks while
+    # the writer is saturated, so only about one batch of vectors exists at once
+    writer = IngestWriter(index, namespace)
+    try:
+        try:
+            for batch in _iter_batches(to_index.items(), INGEST_BATCH_SIZE):
+                dense_vectors = embeddings.embed_documents([doc.page_content for _, doc in batch])
+                writer.submit(_build_vectors(corpus_bm25.encoder, batch, dense_vectors))
+        finally:
+            writer.close()
+    finally:
+        # record every batch that landed, so a failed run resumes where it stopped
+        record_indexed_ids(namespace, writer.completed_ids)
+
     # Create retriever
-    retriever = PineconeHybridSearchRetriever(
+    retriever = NamespacedHybridRetriever(
         embeddings=embeddings,
-        sparse_encoder=sparse_encoder,
-        index=index
+        sparse_encoder=corpus_bm25.encoder,
+        index=index,
+        namespace=namespace,
+        top_k=RETRIEVAL_TOP_K,
+        alpha=RETRIEVAL_ALPHA,
     )
-    retriever.add_texts(texts)
-    
+
     # return retriever and chunks (chunks used by SUMMARIA utilities)
     return retriever, chunks
@@ -0,0 +1,114 @@
+# embedding_cache.py
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class EmbeddingCache:
+    """
+    Persistent text -> embedding cache for one model.
+    Vectors live in a memory-mapped float32 matrix, keyed by the SHA-1 of the
+    text; when the cache is full the least recently used rows are reused.
+    """
+
+    def __init__(self, model_name, dim, capacity=EMBEDDING_CACHE_MAX_ENTRIES, cache_dir=EMBEDDING_CACHE_DIR):
+        self.dim = dim
+        self.capacity = capacity
+        self.path = os.path.join(cache_dir, model_name.replace("/", "__"))
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+
+        meta_path = os.path.join(self.path, "meta.json")
+        meta = {"dim": dim, "capacity": capacity}
+        mode = "r+"
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                if json.load(f) != meta:
+                    mode = "w+"
+        except (OSError, ValueError):
+            mode = "w+"
+        if mode == "w+":
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+        self._vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode=mode, shape=(capacity, dim))
+        self._keys = np.memmap(os.path.join(self.path, "keys.bin"), dtype=np.uint8, mode=mode, shape=(capacity, 20))
+        self._last_used = np.memmap(os.path.join(self.path, "last_used.i64"), dtype=np.int64, mode=mode, shape=(capacity,))
+        self._rows = {self._keys[row].tobytes(): int(row) for row in np.flatnonzero(self._keys.any(axis=1))}
+        self._tick = int(self._last_used.max())
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def encode(self, texts, encode_fn):
+        """
+        Return a float32 matrix of embeddings for texts, calling
+        encode_fn(missing_texts) only for texts not already cached.
+        """
+        keys = [self._key(t) for t in texts]
+        result = np.empty((len(texts), self.dim), dtype=np.float32)
+
+        with self._lock:
+            self._tick += 1
+            missing = {}
+            for i, key in enumerate(keys):
+                row = self._rows.get(key)
+                if row is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    result[i] = self._vectors[row]
+                    self._last_used[row] = self._tick
+
+        if missing:
+            first = [positions[0] for positions in missing.values()]
+            vectors = np.asarray(encode_fn([texts[i] for i in first]), dtype=np.float32)
+            for positions, vec in zip(missing.values(), vectors):
+                result[positions] = vec
+            self._put(list(missing), vectors)
+        return result
+
+    def _put(self, keys, vectors):
+        keys, vectors = keys[-self.capacity:], vectors[-self.capacity:]
+        with self._lock:
+            self._tick += 1
+            keys_vecs = [(k, v) for k, v in zip(keys, vectors) if k not in self._rows]
+            if not keys_vecs:
+                return
+            # empty rows have last_used == 0, so they are taken before any live entry is evicted
+            n = len(keys_vecs)
+            rows = np.argpartition(self._last_used, n - 1)[:n] if n < self.capacity else np.arange(self.capacity)
+            for row, (key, vec) in zip(rows.tolist(), keys_vecs):
+                if self._keys[row].any():
+                    self._rows.pop(self._keys[row].tobytes(), None)
+                self._keys[row] = np.frombuffer(key, dtype=np.uint8)
+                self._vectors[row] = vec
+                self._last_used[row] = self._tick
+                self._rows[key] = row
+            self._vectors.flush()
+            self._keys.flush()
+            self._last_used.flush()
+
+
+def get_embedding_cache(model_name, dim):
+    """
+    Process-wide cache instance shared by ingestion and SUMMARIA metrics.
+    Returns None when caching is disabled (EMBEDDING_CACHE_MAX_ENTRIES = 0).
+    """
+    if EMBEDDING_CACHE_MAX_ENTRIES <= 0:
+        return None
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None or cache.dim != dim:
+            cache = EmbeddingCache(model_name, dim)
+            _caches[model_name] = cache
+        return cache
@@ -7,16 +7,25 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config import *
-from pinecone_setup import initialize_pinecone, delete_existing_index
-from llmembedding_setup import setup_llm
-from document_processor import process_uploaded_files
+from pinecone_setup import delete_namespace
+from pipeline import get_pipeline
+from bm25_state import get_corpus_bm25, drop_corpus_bm25, new_corpus_id, is_valid_corpus_id
+from document_processor import process_uploaded_files, reset_ingest_manifest, corpus_fingerprint
 from prompts import topics_prompt, future_qs_prompt, get_explanation_prompt, composite_verbalize_prompt
 from ui_components import *
 from summaria_utils import persist_feedback
 
-# Initialize components
-index = initialize_pinecone()
-llm, embeddings, bm25_encoder = setup_llm()
+# Initialize components (connected once per process, chains built once per session)
+pipeline = get_pipeline()
+index, embeddings = pipeline.index, pipeline.embeddings
+
+# Each browser session works on its own corpus, resumable through the ?corpus= URL parameter
+if "corpus_id" not in st.session_state:
+    corpus_id = st.query_params.get("corpus")
+    if not is_valid_corpus_id(corpus_id):
+        corpus_id = new_corpus_id()
+        st.query_params["corpus"] = corpus_id
+    st.session_state.corpus_id = corpus_id
 
 # Streamlit UI
 st.title("📚 One Shot - Last Minute Exam Preparation Platform")
@@ -35,11 +44,17 @@ def process_files(uploaded_files):
     """Callback function to process uploaded files"""
     with st.spinner("Processing documents..."):
         try:
-            retriever, chunks = process_uploaded_files(uploaded_files, embeddings, bm25_encoder, index)
-            st.session_state.retriever = retriever
+            corpus_bm25 = get_corpus_bm25(st.session_state.corpus_id)
+            retriever, chunks = process_uploaded_files(
+                uploaded_files, embeddings, corpus_bm25, index, namespace=st.session_state.corpus_id
+            )
+            st.session_state.corpus_bm25 = corpus_bm25
+            pipeline.set_corpus(retriever, corpus_fingerprint(st.session_state.corpus_id))
             st.session_state.chunks = chunks
             st.session_state.docs_processed = True  # ✅ Show next-step buttons after success
             st.success("✅ Documents processed and embedded successfully!")
+            if embeddings.throughput:
+                st.caption(f"Dense embedding throughput: {embeddings.throughput:.1f} chunks/sec")
             st.balloons()
             return True
         except Exception as e:
@@ -85,7 +100,7 @@ if st.session_state.get("docs_processed", False):
 
     with col1:
         st.markdown(
-            '<a class="purple-button" href="http://localhost:5173/" target="_blank">🎯 Take Exam</a>',
+            f'<a class="purple-button" href="http://localhost:5173/?corpus={st.session_state.corpus_id}" target="_blank">🎯 Take Exam</a>',
             unsafe_allow_html=True,
         )
 
@@ -96,34 +111,50 @@ if st.session_state.get("docs_processed", False):
         )
 
 # --- Main interaction section (after retriever setup) ---
-if "retriever" in st.session_state:
+if pipeline.retriever is not None:
     st.divider()
     st.header("📝 Ask About Your Materials")
     
     query = st.text_input("What would you like to know? (e.g., 'important topics', 'potential questions')")
-    
+
+    # Everything at once: topics, questions and both explanations run concurrently
+    render_full_report(
+        pipeline, topics_prompt, future_qs_prompt, get_explanation_prompt,
+        chunks=st.session_state.get("chunks"), sparse_encoder=st.session_state.corpus_bm25.encoder,
+    )
+
+    st.divider()
+
     # Topic analysis
-    topics_response = render_topic_analysis(st.session_state.retriever, llm, topics_prompt)
+    topics_response = render_topic_analysis(pipeline, topics_prompt)
     if topics_response:
-        render_explanation(topics_response, llm, "topics", get_explanation_prompt, chunks=st.session_state.get("chunks"))
+        render_explanation(
+            topics_response, pipeline, "topics", get_explanation_prompt,
+            chunks=st.session_state.get("chunks"), sparse_encoder=st.session_state.corpus_bm25.encoder,
+        )
     
     st.divider()
     
     # Question prediction
-    questions_response = render_question_prediction(st.session_state.retriever, llm, future_qs_prompt)
+    questions_response = render_question_prediction(pipeline, future_qs_prompt)
     if questions_response:
-        render_explanation(questions_response, llm, "questions", get_explanation_prompt, chunks=None)
+        render_explanation(questions_response, pipeline, "questions", get_explanation_prompt, chunks=None)
     
     st.divider()
     render_system_info()
 else:
     st.info("👆 Please upload and process your study materials first")
     
-# --- Delete index button (always visible) ---
-if st.button("🗑️ Delete Existing Pinecone Index"):
-    with st.spinner("Checking and deleting index..."):
-        message = delete_existing_index()
+# --- Delete corpus button (always visible) ---
+if st.button("🗑️ Delete My Documents from the Index"):
+    with st.spinner("Checking and deleting documents..."):
+        message = delete_namespace(st.session_state.corpus_id)
         if "deleted successfully" in message:
+            reset_ingest_manifest(st.session_state.corpus_id)
+            drop_corpus_bm25(st.session_state.corpus_id)
+            pipeline.reset()
+            for key in ("chunks", "corpus_bm25", "docs_processed"):
+                st.session_state.pop(key, None)
             st.success(message)
         else:
             st.warning(message)
@@ -1,6 +1,7 @@
 # pinecone_setup.py
 from pinecone import Pinecone, ServerlessSpec
-from config import PINECONE_API_KEY, INDEX_NAME
+from config import PINECONE_API_KEY, INDEX_NAME, VECTOR_STORE_BACKEND, UPSERT_CONCURRENCY
+from vector_store import get_local_index, delete_local_index
 
 def initialize_pinecone():
     """Initialize Pinecone and create index if it doesn't exist"""
@@ -14,11 +15,39 @@ def initialize_pinecone():
             spec=ServerlessSpec(cloud="aws", region="us-east-1"),
         )
     
-    index = pc.Index(INDEX_NAME)
+    # one pooled connection per concurrent upsert request
+    index = pc.Index(INDEX_NAME, pool_threads=UPSERT_CONCURRENCY)
     return index
 
+def initialize_vector_store():
+    """Return the index for the configured backend (Pinecone or the local offline store)"""
+    if VECTOR_STORE_BACKEND == "local":
+        return get_local_index()
+    return initialize_pinecone()
+
+def delete_namespace(namespace):
+    """Delete one corpus' vectors (its namespace), leaving the index and other corpora intact"""
+    if VECTOR_STORE_BACKEND == "local":
+        index = get_local_index()
+    else:
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+        if INDEX_NAME not in pc.list_indexes().names():
+            return f"⚠️ No index found with the name '{INDEX_NAME}'."
+        index = pc.Index(INDEX_NAME)
+
+    stats = index.describe_index_stats()
+    if namespace not in stats["namespaces"]:
+        return f"⚠️ No documents stored for corpus '{namespace}'."
+    index.delete(delete_all=True, namespace=namespace)
+    return f"✅ Corpus '{namespace}' deleted successfully."
+
 def delete_existing_index():
     """Delete the Pinecone index if it exists"""
+    if VECTOR_STORE_BACKEND == "local":
+        if delete_local_index():
+            return f"✅ Index '{INDEX_NAME}' deleted successfully."
+        return f"⚠️ No index found with the name '{INDEX_NAME}'."
+
     pc = Pinecone(api_key=PINECONE_API_KEY)
     existing_indexes = pc.list_indexes().names()
     if INDEX_NAME in existing_indexes:
@@ -27,4 +56,4 @@ def delete_existing_index():
     else:
         return f"⚠️ No index found with the name '{INDEX_NAME}'."
     
-    
\ No newline at end of file
+    
@@ -0,0 +1,135 @@
+# pipeline.py
+import threading
+import time
+import streamlit as st
+from config import ANALYSIS_MAX_WORKERS, ANALYSIS_QUERIES, LLM_REQUESTS_PER_MINUTE
+from hybrid_retriever import merge_results
+from reranker import mmr_rerank
+from pinecone_setup import initialize_vector_store
+from llmembedding_setup import setup_llm
+from model_registry import get_resource
+
+
+@st.cache_resource(show_spinner=False)
+def get_vector_index():
+    """Index handle for the configured backend, connected once per server process"""
+    return initialize_vector_store()
+
+
+@st.cache_resource(show_spinner=False)
+def get_models():
+    """(llm, embeddings), loaded once per server process"""
+    return setup_llm()
+
+
+class RateLimiter:
+    """
+    Token bucket shared by threads: up to `burst` calls may start at once,
+    after which starts are spaced to `per_minute`. wait() blocks until the
+    caller may start.
+    """
+
+    def __init__(self, per_minute, burst=ANALYSIS_MAX_WORKERS):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1  # reserve a slot, possibly in the future
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+
+def get_llm_rate_limiter():
+    """Process-wide limiter: the LLM quota is per API key, not per session"""
+    return get_resource("llm_rate_limiter", lambda: RateLimiter(LLM_REQUESTS_PER_MINUTE))
+
+
+class StudyPipeline:
+    """
+    Everything one Streamlit session needs to answer questions about its
+    corpus: the shared clients, the corpus retriever, the context retrieved
+    (and reranked) for it and the LLM chains. It lives in st.session_state, so reruns reuse
+    it instead of rebuilding.
+    """
+
+    def __init__(self, index, llm, embeddings):
+        self.index = index
+        self.llm = llm
+        self.embeddings = embeddings
+        self.retriever = None
+        self.corpus_fingerprint = None
+        self.rate_limiter = get_llm_rate_limiter()
+        self._chains = {}
+        self._context = None  # (corpus fingerprint, queries, documents)
+        self._ranked = {}  # query -> reranked shared context
+        self._lock = threading.Lock()
+
+    def set_corpus(self, retriever, corpus_fingerprint):
+        """Point the pipeline at a freshly (re)processed corpus"""
+        with self._lock:
+            self.retriever = retriever
+            self.corpus_fingerprint = corpus_fingerprint
+            self._context = None
+            self._ranked = {}
+
+    def shared_context(self, queries=ANALYSIS_QUERIES):
+        """
+        Context handed to every analysis prompt (and so to their explanations):
+        the de-duplicated union of the retrieval results for `queries`, fetched
+        in one batch and kept until the corpus changes.
+        """
+        queries = tuple(queries)
+        with self._lock:
+            cached = self._context
+            if cached is not None and cached[:2] == (self.corpus_fingerprint, queries):
+                return cached[2]
+            docs = merge_results(self.retriever.retrieve_many(queries))
+            self._context = (self.corpus_fingerprint, queries, docs)
+            self._ranked = {}
+            return docs
+
+    def context_for(self, query):
+        """
+        The shared context reranked for query (MMR on the chunks' cached
+        embeddings) and trimmed to RERANK_TOKEN_BUDGET: what gets stuffed into
+        the prompt answering query.
+        """
+        docs = self.shared_context()
+        with self._lock:
+            ranked = self._ranked.get(query)
+            if ranked is None:
+                vectors = self.embeddings.encode([doc.page_content for doc in docs])
+                ranked = mmr_rerank(self.embeddings.embed_query(query), docs, vectors)
+                self._ranked[query] = ranked
+            return ranked
+
+    def reset(self):
+        """Forget the corpus (e.g. after its documents were deleted)"""
+        self.set_corpus(None, None)
+
+    def chain(self, name, factory):
+        """Return the chain registered under name, calling factory() only the first time"""
+        with self._lock:
+            chain = self._chains.get(name)
+            if chain is None:
+                chain = factory()
+                self._chains[name] = chain
+            return chain
+
+
+def get_pipeline():
+    """This session's pipeline, created on the first run of the script"""
+    if "pipeline" not in st.session_state:
+        llm, embeddings = get_models()
+        st.session_state.pipeline = StudyPipeline(get_vector_index(), llm, embeddings)
+    return st.session_state.pipeline
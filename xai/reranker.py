@@ -0,0 +1,41 @@
+# reranker.py
+import numpy as np
+from config import RERANK_TOKEN_BUDGET, RERANK_LAMBDA, CHARS_PER_TOKEN
+
+
+def estimate_tokens(text):
+    """Rough prompt-token count of text (no tokenizer needed)"""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def mmr_rerank(query_vector, docs, doc_vectors, token_budget=RERANK_TOKEN_BUDGET, lambda_mult=RERANK_LAMBDA):
+    """
+    Reorder retrieved docs by maximal marginal relevance to query_vector and
+    keep as many as fit in token_budget. Relevance is the cosine similarity
+    to the query, redundancy the highest similarity to an already kept doc;
+    lambda_mult = 1 ranks on relevance alone. The best doc is always kept,
+    even when it alone exceeds the budget.
+    """
+    if not docs:
+        return []
+    vectors = np.asarray(doc_vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = vectors @ query
+    redundancy = np.zeros(len(docs), dtype=np.float32)
+    candidates = np.ones(len(docs), dtype=bool)
+    selected, used = [], 0
+    while candidates.any():
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~candidates] = -np.inf
+        best = int(np.argmax(scores))
+        candidates[best] = False
+        cost = estimate_tokens(docs[best].page_content)
+        if selected and used + cost > token_budget:
+            continue  # a shorter candidate may still fit
+        selected.append(best)
+        used += cost
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return [docs[i] for i in selected]
@@ -3,57 +3,92 @@ import os
 import json
 from collections import defaultdict
 from itertools import combinations
-from sentence_transformers import SentenceTransformer
 import numpy as np
+from scipy.sparse import csr_matrix
 import datetime
 from pinecone_text.sparse import BM25Encoder
+from llmembedding_setup import get_embeddings
 
-# Load semantic model
-_embedder = SentenceTransformer("all-MiniLM-L6-v2")
-# Global BM25 encoder
-_bm25 = BM25Encoder().default()
 FEEDBACK_FILE = "summaria_feedback.json"
 
 
-def _sparse_dot(query_vec, doc_vec):
+def _encode_dense(texts):
     """
-    Compute dot product between sparse dicts (indices/values).
+    Normalized MiniLM embeddings from the shared engine (and its on-disk cache).
     """
-    q_idx, q_val = query_vec["indices"], query_vec["values"]
-    d_idx, d_val = doc_vec["indices"], doc_vec["values"]
-    score = 0.0
-    d_map = dict(zip(d_idx, d_val))
-    for i, v in zip(q_idx, q_val):
-        if i in d_map:
-            score += v * d_map[i]
-    return score
+    return get_embeddings().encode(list(texts))
 
 
-def _hybrid_score_dense_sparse(query, docs, alpha=0.6, beta=0.4):
+def _to_csr(sparse_vecs, vocab):
     """
-    Compute hybrid score using semantic (MiniLM) + BM25 sparse matching.
+    Stack Pinecone-style sparse vectors ({"indices", "values"}) into a CSR matrix
+    whose columns are positions in the sorted vocab array.
+    """
+    lengths = [len(v["indices"]) for v in sparse_vecs]
+    indptr = np.zeros(len(sparse_vecs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    if indptr[-1]:
+        indices = np.concatenate([np.asarray(v["indices"], dtype=np.int64) for v in sparse_vecs])
+        values = np.concatenate([np.asarray(v["values"], dtype=np.float64) for v in sparse_vecs])
+    else:
+        indices, values = np.zeros(0, dtype=np.int64), np.zeros(0)
+    return csr_matrix((values, np.searchsorted(vocab, indices), indptr), shape=(len(sparse_vecs), len(vocab)))
+
+
+def _bm25_score_matrix(query_vecs, doc_vecs):
+    """
+    BM25 dot products for every (query, document) pair, shape (queries, docs),
+    computed as a single sparse matrix product. BM25 token IDs are 32-bit
+    hashes, so they are first remapped to a compact shared vocabulary.
+    """
+    vocab = np.unique(np.fromiter(
+        (i for v in list(query_vecs) + list(doc_vecs) for i in v["indices"]), dtype=np.int64
+    ))
+    queries = _to_csr(query_vecs, vocab)
+    docs = _to_csr(doc_vecs, vocab)
+    return (queries @ docs.T).toarray()
+
+
+def _normalize_rows(scores):
+    """Scale each row by its maximum (rows whose maximum is <= 0 are left as is)"""
+    row_max = scores.max(axis=1, keepdims=True)
+    return np.divide(scores, row_max, out=scores, where=row_max > 0)
+
+
+def _hybrid_score_matrix(queries, docs, bm25, alpha=0.6, beta=0.4):
+    """
+    Hybrid (MiniLM + BM25) score matrix of shape (queries, docs).
+    Documents and queries are each encoded once, in a single batch.
+    `bm25` must already be fitted on the corpus the docs come from.
     """
     # Dense embeddings
-    q_vec = _embedder.encode([query], convert_to_numpy=True, normalize_embeddings=True)[0]
-    d_vecs = _embedder.encode(docs, convert_to_numpy=True, normalize_embeddings=True)
-    dense_scores = np.dot(d_vecs, q_vec)
+    q_vecs = _encode_dense(queries)
+    d_vecs = _encode_dense(docs)
+    dense_scores = q_vecs @ d_vecs.T
 
     # Sparse (BM25)
-    sparse_docs = _bm25.encode_documents(docs)
-    q_sparse = _bm25.encode_queries([query])[0]
-    bm25_scores = np.array([_sparse_dot(q_sparse, d) for d in sparse_docs])
+    sparse_docs = bm25.encode_documents(docs)
+    q_sparse = bm25.encode_queries(queries)
+    bm25_scores = _bm25_score_matrix(q_sparse, sparse_docs)
 
-    # Normalize
-    if np.max(dense_scores) > 0:
-        dense_scores = dense_scores / np.max(dense_scores)
-    if np.max(bm25_scores) > 0:
-        bm25_scores = bm25_scores / np.max(bm25_scores)
+    # Normalize per query
+    dense_scores = _normalize_rows(dense_scores.astype(np.float64))
+    bm25_scores = _normalize_rows(bm25_scores)
 
     return alpha * dense_scores + beta * bm25_scores
 
-def compute_topic_metrics(topics, chunks, alpha=0.6, beta=0.4, threshold=0.3):
+
+def _hybrid_score_dense_sparse(query, docs, bm25, alpha=0.6, beta=0.4):
+    """
+    Compute hybrid score using semantic (MiniLM) + BM25 sparse matching.
+    """
+    return _hybrid_score_matrix([query], docs, bm25, alpha, beta)[0]
+
+def compute_topic_metrics(topics, chunks, alpha=0.6, beta=0.4, threshold=0.3, sparse_encoder=None):
     """
     Compute SUMMARIA-style metrics using hybrid (semantic + BM25).
+    Pass the corpus' fitted BM25 encoder as sparse_encoder to avoid refitting;
+    otherwise a private encoder is fitted on the chunks (never a shared one).
     """
     if not topics:
         return {}, {}
@@ -63,16 +98,17 @@ def compute_topic_metrics(topics, chunks, alpha=0.6, beta=0.4, threshold=0.3):
         return {}, {}
 
     # Fit BM25 on chunks if not yet fitted
-    _bm25.fit(chunk_texts)
+    bm25 = sparse_encoder
+    if bm25 is None:
+        bm25 = BM25Encoder().fit(chunk_texts)
 
     topic_info = {}
     topic_chunk_idxs = defaultdict(list)
 
-    for t in topics:
-        sims = _hybrid_score_dense_sparse(t, chunk_texts, alpha, beta)
-        for ci, score in enumerate(sims):
-            if score >= threshold:
-                topic_chunk_idxs[t].append(ci)
+    # One topic x chunk score matrix instead of re-encoding every chunk per topic
+    scores = _hybrid_score_matrix(topics, chunk_texts, bm25, alpha, beta)
+    for t, sims in zip(topics, scores):
+        topic_chunk_idxs[t].extend(np.flatnonzero(sims >= threshold).tolist())
 
     max_chunks = max((len(v) for v in topic_chunk_idxs.values()), default=1)
     n_chunks = len(chunk_texts)
@@ -0,0 +1,378 @@
+# vector_store.py
+# Local, offline vector-store backend.
+# LocalHybridIndex implements the subset of the Pinecone Index API this app uses
+# (upsert / query / fetch / delete / list / describe_index_stats), so it can be
+# handed to PineconeHybridSearchRetriever and document_processor in place of a
+# Pinecone index. Select it with VECTOR_STORE_BACKEND=local.
+import json
+import os
+import shutil
+import threading
+import numpy as np
+from ann_index import IVFIndex
+from config import LOCAL_STORE_DIR
+
+_DEFAULT_NAMESPACE_DIR = "__default__"
+# sparse-only hits kept per requested match when the dense side goes through the ANN index
+_SPARSE_CANDIDATES_PER_K = 10
+
+
+class _Namespace:
+    """
+    One namespace: dense vectors in a memory-mapped float32 matrix, sparse
+    vectors in an inverted index (term -> {row: weight}), and an append-only
+    JSONL log of upserts/deletes that is replayed on load. Once large enough,
+    dense search goes through a persisted IVF index instead of a full scan.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dim = None
+        self.dense = None
+        self.ids = {}  # id -> row
+        self.row_ids = []  # row -> id (None for free rows)
+        self.sparse = []  # row -> {"indices", "values"}
+        self.metadata = []  # row -> dict
+        self.postings = {}  # term -> {row: weight}
+        self.free_rows = set()
+        self.log_records = 0
+        self.ann = IVFIndex()
+        os.makedirs(path, exist_ok=True)
+        self._replay()
+        self._load_ann()
+
+    @property
+    def _log_path(self):
+        return os.path.join(self.path, "records.jsonl")
+
+    @property
+    def _dense_path(self):
+        return os.path.join(self.path, "dense.f32")
+
+    @property
+    def _ann_path(self):
+        return os.path.join(self.path, "ivf.npz")
+
+    def _live_rows(self):
+        return np.fromiter(self.ids.values(), dtype=np.int64, count=len(self.ids))
+
+    def _load_ann(self):
+        """Restore the IVF index and reconcile it with the replayed log"""
+        if self.dense is None or not self.ann.load(self._ann_path):
+            return
+        self.ann._ensure_rows(len(self.row_ids))
+        live = np.zeros(len(self.ann.assign), dtype=bool)
+        live[self._live_rows()] = True
+        self.ann.remove(np.flatnonzero(~live & (self.ann.assign >= 0)))
+        if self.ann.is_trained:
+            self.ann.add(self.dense, np.flatnonzero(live & (self.ann.assign < 0)))
+
+    def _update_ann(self, added_rows=(), removed_rows=()):
+        self.ann.remove(removed_rows)
+        self.ann.add(self.dense, list(added_rows))
+        self.ann.maybe_train(self.dense, self._live_rows())
+        self.ann.save(self._ann_path)
+
+    def _replay(self):
+        if not os.path.exists(self._log_path):
+            return
+        with open(self._log_path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        if records:
+            header = records[0]
+            self._open_dense(header["dim"], header["capacity"])
+        for rec in records[1:]:
+            if rec["op"] == "upsert":
+                self._apply_upsert(rec["id"], rec["row"], rec["sparse"], rec["metadata"])
+            elif rec["op"] == "delete":
+                self._apply_delete(rec["id"])
+        # a compacted log drops deleted rows outright, leaving gaps only row_ids records
+        self.free_rows = {row for row, vid in enumerate(self.row_ids) if vid is None}
+        self.log_records = len(records) - 1
+
+    def _open_dense(self, dim, capacity):
+        self.dim = dim
+        mode = "r+" if os.path.exists(self._dense_path) else "w+"
+        if mode == "r+" and os.path.getsize(self._dense_path) < capacity * dim * 4:
+            with open(self._dense_path, "r+b") as f:
+                f.truncate(capacity * dim * 4)
+        self.dense = np.memmap(self._dense_path, dtype=np.float32, mode=mode, shape=(capacity, dim))
+
+    def _grow(self, needed):
+        capacity = self.dense.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self.dense.flush()
+        del self.dense
+        self._open_dense(self.dim, capacity)
+        self._write_header()
+
+    def _write_header(self):
+        """Rewrite the log as header + one upsert per live row (also compacts it)"""
+        tmp_path = self._log_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"dim": self.dim, "capacity": self.dense.shape[0]}) + "\n")
+            for vid, row in self.ids.items():
+                f.write(json.dumps({
+                    "op": "upsert", "id": vid, "row": row,
+                    "sparse": self.sparse[row], "metadata": self.metadata[row],
+                }) + "\n")
+        os.replace(tmp_path, self._log_path)
+        self.log_records = len(self.ids)
+
+    def _apply_upsert(self, vid, row, sparse, metadata):
+        if vid in self.ids:
+            self._unindex_sparse(self.ids[vid])
+        while len(self.row_ids) <= row:
+            self.row_ids.append(None)
+            self.sparse.append(None)
+            self.metadata.append(None)
+        self.free_rows.discard(row)
+        self.ids[vid] = row
+        self.row_ids[row] = vid
+        self.sparse[row] = sparse
+        self.metadata[row] = metadata
+        for term, weight in zip(sparse["indices"], sparse["values"]):
+            self.postings.setdefault(term, {})[row] = weight
+
+    def _unindex_sparse(self, row):
+        sparse = self.sparse[row]
+        if sparse:
+            for term in sparse["indices"]:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(row, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def _apply_delete(self, vid):
+        row = self.ids.pop(vid, None)
+        if row is None:
+            return
+        self._unindex_sparse(row)
+        self.row_ids[row] = None
+        self.sparse[row] = None
+        self.metadata[row] = None
+        if self.dense is not None:
+            self.dense[row] = 0.0
+        self.free_rows.add(row)
+
+    def upsert(self, vectors):
+        if not vectors:
+            return 0
+        if self.dense is None:
+            self._open_dense(len(vectors[0]["values"]), max(1024, len(vectors)))
+            self._write_header()
+
+        records = []
+        for vec in vectors:
+            vid = vec["id"]
+            if vid in self.ids:
+                row = self.ids[vid]
+            elif self.free_rows:
+                row = min(self.free_rows)
+            else:
+                row = len(self.row_ids)
+            self._grow(row + 1)
+            sparse = vec.get("sparse_values") or {"indices": [], "values": []}
+            sparse = {"indices": [int(i) for i in sparse["indices"]], "values": [float(v) for v in sparse["values"]]}
+            metadata = dict(vec.get("metadata") or {})
+            self.dense[row] = np.asarray(vec["values"], dtype=np.float32)
+            self._apply_upsert(vid, row, sparse, metadata)
+            records.append({"op": "upsert", "id": vid, "row": row, "sparse": sparse, "metadata": metadata})
+
+        self.dense.flush()
+        self._append_log(records)
+        self._update_ann(added_rows=[rec["row"] for rec in records])
+        return len(records)
+
+    def delete(self, ids):
+        records, rows = [], []
+        for vid in ids:
+            if vid in self.ids:
+                rows.append(self.ids[vid])
+                self._apply_delete(vid)
+                records.append({"op": "delete", "id": vid})
+        if records:
+            self.dense.flush()
+            self._append_log(records)
+            self._update_ann(removed_rows=rows)
+
+    def _append_log(self, records):
+        with open(self._log_path, "a", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec) + "\n")
+        self.log_records += len(records)
+        if self.log_records > 2 * max(len(self.ids), 1024):
+            self._write_header()
+
+    def _sparse_scores(self, sparse_vector, n_rows):
+        """Sparse dot products for every row via the inverted index (None without a sparse query)"""
+        if not sparse_vector or not len(sparse_vector.get("indices", [])):
+            return None
+        scores = np.zeros(n_rows, dtype=np.float32)
+        for term, weight in zip(sparse_vector["indices"], sparse_vector["values"]):
+            postings = self.postings.get(int(term))
+            if postings:
+                rows = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+                vals = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+                np.add.at(scores, rows, weight * vals)
+        return scores
+
+    def top_k(self, vector, sparse_vector, k):
+        """Rows and dotproduct hybrid scores of the k best matches, best first"""
+        n_rows = len(self.row_ids)
+        sparse_scores = self._sparse_scores(sparse_vector, n_rows)
+
+        if vector is not None and self.ann.is_trained:
+            # approximate: dense candidates from the probed IVF buckets plus the best sparse hits
+            query = np.asarray(vector, dtype=np.float32)
+            candidates = self.ann.search(query)
+            if sparse_scores is not None:
+                hits = np.flatnonzero(sparse_scores)
+                limit = k * _SPARSE_CANDIDATES_PER_K
+                if len(hits) > limit:
+                    hits = hits[np.argpartition(-sparse_scores[hits], limit - 1)[:limit]]
+                candidates = np.union1d(candidates, hits)
+            else:
+                candidates = np.sort(candidates)
+            scores = self.dense[candidates] @ query
+            if sparse_scores is not None:
+                scores += sparse_scores[candidates]
+        else:
+            # exact: score every row
+            candidates = np.arange(n_rows)
+            scores = np.zeros(n_rows, dtype=np.float32)
+            if vector is not None and n_rows:
+                scores += self.dense[:n_rows] @ np.asarray(vector, dtype=np.float32)
+            if sparse_scores is not None:
+                scores += sparse_scores
+            if self.free_rows:
+                scores[list(self.free_rows)] = -np.inf
+
+        k = min(k, len(self.ids), len(candidates))
+        if k <= 0:
+            return candidates[:0], scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    def record(self, row, include_values=False, include_metadata=True):
+        rec = {"id": self.row_ids[row]}
+        if include_metadata:
+            rec["metadata"] = dict(self.metadata[row])
+        if include_values:
+            rec["values"] = self.dense[row].tolist()
+            rec["sparse_values"] = {k: list(v) for k, v in self.sparse[row].items()}
+        return rec
+
+
+class LocalHybridIndex:
+    """In-process hybrid (dense + sparse) index with a Pinecone-compatible surface"""
+
+    def __init__(self, path=LOCAL_STORE_DIR):
+        self.path = path
+        self._namespaces = {}
+        self._lock = threading.RLock()
+
+    def _namespace(self, namespace, create=True):
+        namespace = namespace or ""
+        ns = self._namespaces.get(namespace)
+        if ns is None:
+            ns_path = os.path.join(self.path, namespace or _DEFAULT_NAMESPACE_DIR)
+            if not create and not os.path.isdir(ns_path):
+                return None
+            ns = _Namespace(ns_path)
+            self._namespaces[namespace] = ns
+        return ns
+
+    def upsert(self, vectors, namespace=None, **kwargs):
+        with self._lock:
+            count = self._namespace(namespace).upsert(list(vectors))
+        return {"upserted_count": count}
+
+    def query(self, vector=None, sparse_vector=None, top_k=10, namespace=None,
+              include_values=False, include_metadata=False, **kwargs):
+        with self._lock:
+            ns = self._namespace(namespace, create=False)
+            if ns is None or not ns.ids:
+                return {"matches": [], "namespace": namespace or ""}
+            rows, scores = ns.top_k(vector, sparse_vector, top_k)
+            matches = []
+            for row, score in zip(rows.tolist(), scores.tolist()):
+                match = ns.record(row, include_values, include_metadata)
+                match["score"] = float(score)
+                matches.append(match)
+        return {"matches": matches, "namespace": namespace or ""}
+
+    def fetch(self, ids, namespace=None, **kwargs):
+        with self._lock:
+            ns = self._namespace(namespace, create=False)
+            vectors = {}
+            if ns is not None:
+                for vid in ids:
+                    row = ns.ids.get(vid)
+                    if row is not None:
+                        vectors[vid] = ns.record(row, include_values=True)
+        return {"vectors": vectors, "namespace": namespace or ""}
+
+    def delete(self, ids=None, delete_all=False, namespace=None, **kwargs):
+        with self._lock:
+            if delete_all:
+                ns = self._namespaces.pop(namespace or "", None)
+                ns_path = os.path.join(self.path, namespace or _DEFAULT_NAMESPACE_DIR)
+                if ns is not None and ns.dense is not None:
+                    del ns.dense
+                shutil.rmtree(ns_path, ignore_errors=True)
+            else:
+                ns = self._namespace(namespace, create=False)
+                if ns is not None:
+                    ns.delete(ids or [])
+        return {}
+
+    def list(self, prefix=None, limit=100, namespace=None, **kwargs):
+        """Yield pages of vector IDs, like Index.list() on a serverless index"""
+        with self._lock:
+            ns = self._namespace(namespace, create=False)
+            ids = [vid for vid in (ns.ids if ns else {}) if not prefix or vid.startswith(prefix)]
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            if os.path.isdir(self.path):
+                for name in os.listdir(self.path):
+                    self._namespace("" if name == _DEFAULT_NAMESPACE_DIR else name)
+            namespaces = {name: {"vector_count": len(ns.ids)} for name, ns in self._namespaces.items()}
+            dims = [ns.dim for ns in self._namespaces.values() if ns.dim]
+        return {
+            "dimension": dims[0] if dims else None,
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values()),
+        }
+
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_index():
+    """Process-wide LocalHybridIndex rooted at LOCAL_STORE_DIR"""
+    global _local_index
+    with _local_index_lock:
+        if _local_index is None:
+            _local_index = LocalHybridIndex()
+        return _local_index
+
+
+def delete_local_index():
+    """Remove every namespace of the local index from memory and disk"""
+    global _local_index
+    with _local_index_lock:
+        _local_index = None
+        if os.path.isdir(LOCAL_STORE_DIR):
+            shutil.rmtree(LOCAL_STORE_DIR)
+            return True
+        return False